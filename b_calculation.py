@@ -1,13 +1,20 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from itertools import islice
+import os
 import numpy as np
 from scipy.integrate import quad_vec
+from scipy.special import ellipkinc, ellipeinc
+
+from lines import Straight, Curved
+import jit_kernels
 
 # THIS NEEDS TO BE OPTIMIZED SO THAT IT RUNS WAY FASTER - CURRENT MAIN BOTTLENECK FOR PROGRAM
 
 def comp_calc(dB_dt : callable, lower_lim : float, upper_lim : float, x : float, y : float, z : float):
     comp = quad_vec(dB_dt, lower_lim, upper_lim, args=(x, y, z), epsabs = 1e-06, epsrel = 1e-06,)[0]
-    if type(comp) == float:
-        comp = np.full(z.shape, comp)
-    return comp
+    # Constant components come back as a float; open grid vectors may leave singleton axes
+    return np.broadcast_to(comp, np.broadcast_shapes(np.shape(x), np.shape(y), np.shape(z)))
 
 
 def B(lower_lim : float, upper_lim : float, dBxdt : callable, dBydt : callable, 
@@ -23,3 +30,976 @@ def B(lower_lim : float, upper_lim : float, dBxdt : callable, dBydt : callable,
     print('finished z_comp')
 
     return np.array([x_comp, y_comp, z_comp])
+
+
+def dBdt_components(position : callable, tangent : callable) -> tuple[callable, callable, callable]:
+    '''
+    Build the x, y, and z components of the Biot-Savart integrand dl/dt x (r - l) / |r - l|^3 from
+    numeric line evaluators (no sympy needed)
+
+    Parameters
+    ----------
+    position : callable
+        position(t) returning the (3, *np.shape(t)) position on the line
+    tangent : callable
+        tangent(t) returning the (3, *np.shape(t)) derivative of the position with respect to t
+
+    Returns
+    -------
+    callable, callable, callable
+        dBxdt, dBydt, and dBzdt, each called as dBdt(t, x, y, z) with t and x, y, z broadcastable
+    '''
+    def separation(t, x, y, z):
+        l = position(t)
+        dl = tangent(t)
+        sep_x, sep_y, sep_z = x - l[0], y - l[1], z - l[2]
+        inv_norm_3 = (sep_x ** 2 + sep_y ** 2 + sep_z ** 2) ** -1.5
+        return dl, sep_x, sep_y, sep_z, inv_norm_3
+
+    def dBxdt(t, x, y, z):
+        dl, sep_x, sep_y, sep_z, inv_norm_3 = separation(t, x, y, z)
+        return (dl[1] * sep_z - dl[2] * sep_y) * inv_norm_3
+
+    def dBydt(t, x, y, z):
+        dl, sep_x, sep_y, sep_z, inv_norm_3 = separation(t, x, y, z)
+        return (dl[2] * sep_x - dl[0] * sep_z) * inv_norm_3
+
+    def dBzdt(t, x, y, z):
+        dl, sep_x, sep_y, sep_z, inv_norm_3 = separation(t, x, y, z)
+        return (dl[0] * sep_y - dl[1] * sep_x) * inv_norm_3
+
+    return dBxdt, dBydt, dBzdt
+
+
+@lru_cache(maxsize=None)
+def gauss_legendre_nodes(n_nodes : int) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Gauss-Legendre nodes and weights on [-1, 1], computed once per node count
+    '''
+    nodes, weights = np.polynomial.legendre.leggauss(n_nodes)
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return nodes, weights
+
+
+def B_gauss_legendre(lower_lim : float, upper_lim : float, dBxdt : callable, dBydt : callable,
+                     dBzdt : callable, x : np.ndarray, y : np.ndarray, z : np.ndarray,
+                     n_nodes : int = 64, chunk_size : int = 16) -> np.ndarray:
+    '''
+    Integrate dBdt along the length of the wire using a fixed-order Gauss-Legendre rule
+
+    Alternative to B (which uses adaptive quad_vec and remains the reference): every voxel is
+    evaluated at the same n_nodes parameter values, so the integrand is called once per chunk of
+    nodes as a single broadcast (chunk, *x.shape) operation instead of once per adaptive
+    subdivision. Accuracy is controlled by n_nodes only; voxels very close to the wire (relative
+    to the segment length) need more nodes than far ones.
+
+    Parameters
+    ----------
+    lower_lim : float
+        The lower limit of integration
+    upper_lim : float
+        The upper limit of integration
+    dBxdt : callable
+        X-component of the integrand, called as dBxdt(t, x, y, z)
+    dBydt : callable
+        Y-component of the integrand, called as dBydt(t, x, y, z)
+    dBzdt : callable
+        Z-component of the integrand, called as dBzdt(t, x, y, z)
+    x : np.ndarray
+        X-coordinates at which to evaluate the field
+    y : np.ndarray
+        Y-coordinates at which to evaluate the field; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates at which to evaluate the field; must broadcast with x and y
+    n_nodes : int - Optional
+        Number of quadrature nodes along the segment; trades accuracy for speed
+    chunk_size : int - Optional
+        Number of nodes evaluated per broadcast call; bounds the temporary memory to
+        chunk_size full-size arrays per component
+
+    Returns
+    -------
+    np.ndarray
+        Array of the x, y, and z components of the field (first dimension is size 3)
+    '''
+    nodes, weights = gauss_legendre_nodes(n_nodes)
+    half_len = (upper_lim - lower_lim) / 2
+    mid = (upper_lim + lower_lim) / 2
+    t_nodes = half_len * nodes + mid
+    t_weights = half_len * weights
+
+    shape = np.broadcast_shapes(np.shape(x), np.shape(y), np.shape(z))
+    B_field = np.zeros((3,) + shape)
+
+    for i in range(0, n_nodes, chunk_size):
+        t = t_nodes[i:i + chunk_size].reshape((-1,) + (1,) * len(shape))
+        w = t_weights[i:i + chunk_size]
+        for comp, dBdt in enumerate((dBxdt, dBydt, dBzdt)):
+            # Components that are identically zero lambdify to a scalar
+            vals = np.broadcast_to(dBdt(t, x, y, z), (len(w),) + shape)
+            B_field[comp] += np.tensordot(w, vals, axes=1)
+
+    return B_field
+
+
+def adaptive_B(lower_lim : float, upper_lim : float, position : callable, tangent : callable,
+               x : np.ndarray, y : np.ndarray, z : np.ndarray, n_nodes : int = 8, n_panels : int = 4,
+               ratio : float = 1., max_depth : int = 30) -> np.ndarray:
+    '''
+    Integrate the Biot-Savart law along the wire with per-voxel adaptive Gauss-Legendre panels
+
+    Unlike quad_vec in B, whose error norm spans all voxels (so the voxels next to the wire drive
+    the subdivision of the whole volume), refinement is decided voxel by voxel: the segment is cut
+    into n_panels panels, each evaluated with a low-order n_nodes rule for every voxel at least
+    ratio panel lengths away from it, and halved again only for the voxels closer than that. Far
+    voxels therefore cost n_panels * n_nodes kernel evaluations, while near ones get panels as
+    short as their distance requires. With the defaults the relative error stays around 1e-8,
+    well within that of quad_vec with epsabs = epsrel = 1e-6, at a fraction of its cost.
+
+    Parameters
+    ----------
+    lower_lim : float
+        The lower limit of integration
+    upper_lim : float
+        The upper limit of integration
+    position : callable
+        position(t) returning the (3, *np.shape(t)) position on the line
+    tangent : callable
+        tangent(t) returning the (3, *np.shape(t)) derivative of the position with respect to t
+    x : np.ndarray
+        X-coordinates at which to evaluate the field
+    y : np.ndarray
+        Y-coordinates at which to evaluate the field; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates at which to evaluate the field; must broadcast with x and y
+    n_nodes : int - Optional
+        Number of Gauss-Legendre nodes per panel
+    n_panels : int - Optional
+        Number of panels the segment is initially cut into
+    ratio : float - Optional
+        Minimum distance from a panel's nodes, in panel lengths, for a voxel to accept the panel
+    max_depth : int - Optional
+        Maximum number of times a panel is halved; voxels on the wire itself are accepted there
+        (and nodes they coincide with contribute zero)
+
+    Returns
+    -------
+    np.ndarray
+        Array of the x, y, and z components of the field (first dimension is size 3)
+    '''
+    shape = np.broadcast_shapes(np.shape(x), np.shape(y), np.shape(z))
+    points = np.array(np.broadcast_arrays(x, y, z), dtype=float).reshape(3, -1)
+    B_field = np.zeros(points.shape)
+    nodes, weights = gauss_legendre_nodes(n_nodes)
+
+    edges = np.linspace(lower_lim, upper_lim, n_panels + 1)
+    panels = [(edges[i], edges[i + 1], np.arange(points.shape[1]), 0) for i in range(n_panels)]
+
+    while panels:
+        low, up, index, depth = panels.pop()
+        half_len = (up - low) / 2
+        t = half_len * nodes + (up + low) / 2
+        pos = position(t)
+        dl = tangent(t) * half_len * weights
+        length = np.sum(np.sqrt(np.sum(dl ** 2, axis=0)))
+
+        sep = points[:, index, None] - pos[:, :, None].transpose(0, 2, 1) # (3, voxels, nodes)
+        dist_sq = np.sum(sep ** 2, axis=0)
+
+        near = np.min(dist_sq, axis=1) < (ratio * length) ** 2
+        if depth < max_depth and np.any(near):
+            mid = (low + up) / 2
+            panels.append((low, mid, index[near], depth + 1))
+            panels.append((mid, up, index[near], depth + 1))
+            far = ~near
+            index, sep, dist_sq = index[far], sep[:, far], dist_sq[far]
+
+        with np.errstate(divide='ignore'):
+            inv_norm_3 = np.where(dist_sq > 0, dist_sq, np.inf) ** -1.5
+        B_field[0, index] += np.sum((dl[1] * sep[2] - dl[2] * sep[1]) * inv_norm_3, axis=1)
+        B_field[1, index] += np.sum((dl[2] * sep[0] - dl[0] * sep[2]) * inv_norm_3, axis=1)
+        B_field[2, index] += np.sum((dl[0] * sep[1] - dl[1] * sep[0]) * inv_norm_3, axis=1)
+
+    return B_field.reshape((3,) + shape)
+
+
+def straight_B(start : np.ndarray, end : np.ndarray, x : np.ndarray, y : np.ndarray, z : np.ndarray) -> np.ndarray:
+    '''
+    Closed-form magnetic field of a finite straight wire carrying current from start to end
+
+    Uses the exact Biot-Savart solution for a straight filament (with all physical constants
+    and the current taken to be one), so no numerical integration is needed. With R1 and R2 the
+    vectors from the wire's endpoints to the point in space and L the wire's direction vector:
+
+        B = (L x R1) * 2 (|R1| + |R2|) / (|R1| |R2| ((|R1| + |R2|)^2 - |L|^2))
+
+    This form is free of the cancellation the textbook cosine form suffers from near the line's
+    extension. Points lying on the wire itself (where the field is undefined) are set to zero.
+
+    Parameters
+    ----------
+    start : np.ndarray
+        3-element start point of the wire (i.e., the position at the lower integration limit)
+    end : np.ndarray
+        3-element end point of the wire (i.e., the position at the upper integration limit)
+    x : np.ndarray
+        X-coordinates at which to evaluate the field
+    y : np.ndarray
+        Y-coordinates at which to evaluate the field; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates at which to evaluate the field; must broadcast with x and y
+
+    Returns
+    -------
+    np.ndarray
+        Array of the x, y, and z components of the field (first dimension is size 3)
+    '''
+    d_x, d_y, d_z = end[0] - start[0], end[1] - start[1], end[2] - start[2]
+
+    r1_x, r1_y, r1_z = x - start[0], y - start[1], z - start[2]
+    r2_x, r2_y, r2_z = x - end[0], y - end[1], z - end[2]
+
+    r1 = np.sqrt(r1_x ** 2 + r1_y ** 2 + r1_z ** 2)
+    r2 = np.sqrt(r2_x ** 2 + r2_y ** 2 + r2_z ** 2)
+    r_sum = r1 + r2
+
+    denom = r1 * r2 * (r_sum ** 2 - (d_x ** 2 + d_y ** 2 + d_z ** 2))
+    # Zero denominator only happens on the wire itself
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(denom > 0, 2 * r_sum / denom, 0.)
+
+    return np.array([(d_y * r1_z - d_z * r1_y) * scale,
+                     (d_z * r1_x - d_x * r1_z) * scale,
+                     (d_x * r1_y - d_y * r1_x) * scale])
+
+
+def _ellip_d_inc(phi : np.ndarray, m : np.ndarray) -> np.ndarray:
+    '''
+    Incomplete elliptic integral D(phi, m) = (F(phi, m) - E(phi, m)) / m
+
+    F - E loses all precision to cancellation as m -> 0 (i.e., close to the axis of an arc), so
+    a short series in m is used there instead
+    '''
+    small = m < 1e-3
+    m_safe = np.where(small, 1., m)
+    direct = (ellipkinc(phi, m_safe) - ellipeinc(phi, m_safe)) / m_safe
+
+    # D = int_0^phi sin^2 / sqrt(1 - m sin^2) = I2 + m I4 / 2 + 3 m^2 I6 / 8 + O(m^3)
+    i2 = phi / 2 - np.sin(2 * phi) / 4
+    i4 = 3 * phi / 8 - np.sin(2 * phi) / 4 + np.sin(4 * phi) / 32
+    i6 = 5 * phi / 16 - 15 * np.sin(2 * phi) / 64 + 3 * np.sin(4 * phi) / 64 - np.sin(6 * phi) / 192
+    series = i2 + m * i4 / 2 + 3 * m ** 2 * i6 / 8
+
+    return np.where(small, series, direct)
+
+
+def arc_B(centre : np.ndarray, r1 : np.ndarray, r2 : np.ndarray, lower_lim : float, upper_lim : float,
+          x : np.ndarray, y : np.ndarray, z : np.ndarray) -> np.ndarray:
+    '''
+    Magnetic field of a circular arc c + r1 cos(t) + r2 sin(t), t in [lower_lim, upper_lim],
+    using incomplete elliptic integrals
+
+    The field point is expressed in cylindrical coordinates (rho, phi, z) about the arc's axis.
+    With psi = t - phi and the substitution psi = pi - 2 theta, the radial and axial components
+    reduce to incomplete elliptic integrals of the first and second kind with parameter
+    m = 4 a rho / ((a + rho)^2 + z^2), while the azimuthal component has an elementary
+    antiderivative. Points lying on the circle itself (where the integrals diverge) are set to
+    zero.
+
+    Parameters
+    ----------
+    centre : np.ndarray
+        3-element centre of the circle
+    r1 : np.ndarray
+        3-element first radius vector; must be perpendicular to r2 and of equal length
+    r2 : np.ndarray
+        3-element second radius vector; must be perpendicular to r1 and of equal length
+    lower_lim : float
+        The lower limit of integration (angle along the circle, measured from r1 towards r2)
+    upper_lim : float
+        The upper limit of integration
+    x : np.ndarray
+        X-coordinates at which to evaluate the field
+    y : np.ndarray
+        Y-coordinates at which to evaluate the field; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates at which to evaluate the field; must broadcast with x and y
+
+    Returns
+    -------
+    np.ndarray
+        Array of the x, y, and z components of the field (first dimension is size 3)
+    '''
+    a = np.sqrt(r1[0] ** 2 + r1[1] ** 2 + r1[2] ** 2)
+    e1 = [r1[0] / a, r1[1] / a, r1[2] / a]
+    e2 = [r2[0] / a, r2[1] / a, r2[2] / a]
+    n = [e1[1] * e2[2] - e1[2] * e2[1], e1[2] * e2[0] - e1[0] * e2[2], e1[0] * e2[1] - e1[1] * e2[0]]
+
+    # Field point in the arc's frame
+    p_x, p_y, p_z = x - centre[0], y - centre[1], z - centre[2]
+    u = p_x * e1[0] + p_y * e1[1] + p_z * e1[2]
+    v = p_x * e2[0] + p_y * e2[1] + p_z * e2[2]
+    w = p_x * n[0] + p_y * n[1] + p_z * n[2]
+
+    rho = np.sqrt(u ** 2 + v ** 2)
+    phi = np.arctan2(v, u)
+    psi_1 = lower_lim - phi
+    psi_2 = upper_lim - phi
+
+    s = (a + rho) ** 2 + w ** 2
+    m = 4 * a * rho / s
+    mc = (a - rho) ** 2 + w ** 2 # = s * (1 - m), without the cancellation
+    on_wire = mc <= 0
+    mc = np.where(on_wire, 1., mc) / s
+
+    # Integrate over theta from theta_2 to theta_1 (d psi = -2 d theta)
+    theta_1 = (np.pi - psi_1) / 2
+    theta_2 = (np.pi - psi_2) / 2
+
+    # The circle itself is singular; those points are masked out below
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = ellipkinc(theta_1, m) - ellipkinc(theta_2, m)
+        e = ellipeinc(theta_1, m) - ellipeinc(theta_2, m)
+        d = _ellip_d_inc(theta_1, m) - _ellip_d_inc(theta_2, m)
+        scd = (np.sin(theta_1) * np.cos(theta_1) / np.sqrt(1 - m * np.sin(theta_1) ** 2)
+               - np.sin(theta_2) * np.cos(theta_2) / np.sqrt(1 - m * np.sin(theta_2) ** 2))
+
+        p3 = (e - m * scd) / mc # int 1 / Delta^3
+        q = (f - d - scd) / mc # int sin^2 / Delta^3
+
+        s_32 = s ** -1.5
+        b_rho = 2 * a * w * s_32 * (2 * q - p3)
+        b_w = 2 * a * s_32 * ((a + rho) * p3 - 2 * rho * q)
+
+        # Azimuthal component in closed form, rearranged to stay finite on the axis
+        a_sq = rho ** 2 + a ** 2 + w ** 2
+        sqrt_d1 = np.sqrt(np.maximum(a_sq - 2 * a * rho * np.cos(psi_1), 0.))
+        sqrt_d2 = np.sqrt(np.maximum(a_sq - 2 * a * rho * np.cos(psi_2), 0.))
+        b_phi = -2 * a * w * (np.cos(psi_2) - np.cos(psi_1)) / (sqrt_d1 * sqrt_d2 * (sqrt_d1 + sqrt_d2))
+
+        b_rho = np.where(on_wire, 0., b_rho)
+        b_phi = np.where(on_wire | ~np.isfinite(b_phi), 0., b_phi)
+        b_w = np.where(on_wire, 0., b_w)
+
+    # Back to the global frame
+    cos_phi, sin_phi = np.cos(phi), np.sin(phi)
+    b_1 = b_rho * cos_phi - b_phi * sin_phi
+    b_2 = b_rho * sin_phi + b_phi * cos_phi
+
+    return np.array([b_1 * e1[0] + b_2 * e2[0] + b_w * n[0],
+                     b_1 * e1[1] + b_2 * e2[1] + b_w * n[1],
+                     b_1 * e1[2] + b_2 * e2[2] + b_w * n[2]])
+
+
+def grid_axes(volume_coords : list, vol_res : list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Get the x, y, and z coordinate vectors of the voxel grid spanning a volume
+
+    Parameters
+    ----------
+    volume_coords : list
+        6-element list of the volume (x-min, x-max, y-min, y-max, z-min, z-max)
+    vol_res : list
+        3-element list of the volume resolution in x, y, and z
+
+    Returns
+    -------
+    np.ndarray, np.ndarray, np.ndarray
+        1D coordinate vectors along x, y, and z
+    '''
+    # Add small tolerance to endpoint so it's included
+    x_dim = np.arange(volume_coords[0], volume_coords[1] + 1e-10, vol_res[0])
+    y_dim = np.arange(volume_coords[2], volume_coords[3] + 1e-10, vol_res[1])
+    z_dim = np.arange(volume_coords[4], volume_coords[5] + 1e-10, vol_res[2])
+
+    return x_dim, y_dim, z_dim
+
+
+def coarse_index(n_points : int, step : int) -> np.ndarray:
+    '''
+    Indices of every step-th of n_points grid points, always including the last one (so a coarse grid
+    still spans the whole volume)
+    '''
+    return np.unique(np.r_[np.arange(0, n_points, max(1, step)), n_points - 1])
+
+
+def upsample(field : np.ndarray, indices : tuple, shape : tuple) -> np.ndarray:
+    '''
+    Linearly interpolate a field sampled on a coarse grid back onto the full grid
+
+    Parameters
+    ----------
+    field : np.ndarray
+        Array whose last three dimensions are the coarse grid, e.g. (3, nx, ny, nz)
+    indices : tuple
+        Indices of the coarse grid points along x, y, and z within the full grid (see coarse_index)
+    shape : tuple
+        Number of points of the full grid along x, y, and z
+
+    Returns
+    -------
+    np.ndarray
+        Array with the last three dimensions of the full grid
+    '''
+    for axis, (index, n_points) in enumerate(zip(indices, shape)):
+        # (n_points, len(index)) matrix of the linear interpolation weights along this axis
+        weights = np.array([np.interp(np.arange(n_points), index, column) for column in np.eye(len(index))]).T
+        field = np.moveaxis(np.tensordot(weights, np.moveaxis(field, axis - 3, 0), axes=1), 0, axis - 3)
+
+    return field
+
+
+def tiled_B(kernel : callable, x_dim : np.ndarray, y_dim : np.ndarray, z_dim : np.ndarray,
+            tile : tuple = None, out : np.ndarray = None) -> np.ndarray:
+    '''
+    Evaluate a field kernel over a voxel grid tile by tile
+
+    Each tile is passed to the kernel as open, broadcastable coordinate vectors of shape
+    (bx, 1, 1), (1, by, 1), and (1, 1, bz), so no dense meshgrid is ever built and the kernel's
+    temporaries are proportional to the tile rather than the whole grid. A tile of (None, None, k)
+    processes the grid in z-slabs of k planes.
+
+    Parameters
+    ----------
+    kernel : callable
+        kernel(x, y, z) returning an array of shape (..., bx, by, bz) for the tile
+    x_dim : np.ndarray
+        1D coordinate vector along x
+    y_dim : np.ndarray
+        1D coordinate vector along y
+    z_dim : np.ndarray
+        1D coordinate vector along z
+    tile : tuple, optional
+        Number of voxels per tile along x, y, and z (None for the full extent); defaults to the
+        whole grid in one tile
+    out : np.ndarray, optional
+        Array of shape (..., Nx, Ny, Nz) to write into; allocated from the first tile otherwise
+
+    Returns
+    -------
+    np.ndarray
+        The kernel evaluated over the whole grid, of shape (..., Nx, Ny, Nz)
+    '''
+    dims = (len(x_dim), len(y_dim), len(z_dim))
+    tile = tile if tile is not None else (None, None, None)
+    steps = [max(1, step) if step is not None else max(1, dim) for step, dim in zip(tile, dims)]
+
+    for i in range(0, dims[0], steps[0]):
+        for j in range(0, dims[1], steps[1]):
+            for k in range(0, dims[2], steps[2]):
+                xs, ys, zs = slice(i, i + steps[0]), slice(j, j + steps[1]), slice(k, k + steps[2])
+                block = kernel(x_dim[xs, None, None], y_dim[None, ys, None], z_dim[None, None, zs])
+                if out is None:
+                    out = np.empty(block.shape[:-3] + dims, dtype=block.dtype)
+                out[..., xs, ys, zs] = block
+
+    return out
+
+
+def pack_geometry(coils : list, n_nodes : int = 64) -> dict:
+    '''
+    Pack the geometry of every segment of every coil into flat arrays for scanner_B
+
+    Straight segments are stored by their end points and circular Curved segments by their centre,
+    radius vectors and limits, so both keep their closed-form solutions. Every other segment (i.e.,
+    true ellipses) is replaced by its Gauss-Legendre nodes: the position of each node and its
+    weighted tangent (the current element dl); their ellipse parameters are kept as well so that
+    scanner_B can refine the voxels closer to them than a few node spacings (see refine_ellipses).
+    The result only holds NumPy arrays and ints.
+
+    Parameters
+    ----------
+    coils : list
+        List of coils (anything with a segments attribute holding Segment objects)
+    n_nodes : int - Optional
+        Number of Gauss-Legendre nodes used for each segment without a closed-form solution
+
+    Returns
+    -------
+    dict
+        'n_coils', 'n_nodes' and, for each segment kind, the packed arrays together with the index
+        of the coil each entry belongs to ('straight_coil', 'arc_coil', 'node_coil', 'ellipse_coil')
+    '''
+    straight_start, straight_end, straight_coil = [], [], []
+    arc_centre, arc_r1, arc_r2, arc_lims, arc_coil = [], [], [], [], []
+    node_pos, node_dl, node_coil = [], [], []
+    ellipse_centre, ellipse_r1, ellipse_r2, ellipse_lims, ellipse_coil = [], [], [], [], []
+
+    nodes, weights = gauss_legendre_nodes(n_nodes)
+
+    for i, coil in enumerate(coils):
+        for segment in coil.segments:
+            line = segment.line_fn
+            if type(line) == Straight:
+                straight_start.append(line.position(segment.low_lim))
+                straight_end.append(line.position(segment.up_lim))
+                straight_coil.append(i)
+            elif type(line) == Curved and line.is_circular():
+                arc_centre.append(line.centre)
+                arc_r1.append(line.r1)
+                arc_r2.append(line.r2)
+                arc_lims.append((segment.low_lim, segment.up_lim))
+                arc_coil.append(i)
+            else:
+                half_len = (segment.up_lim - segment.low_lim) / 2
+                t_nodes = half_len * nodes + (segment.up_lim + segment.low_lim) / 2
+                node_pos.extend(line.position(t_nodes).T)
+                node_dl.extend((line.tangent(t_nodes) * half_len * weights).T)
+                node_coil.extend([i] * n_nodes)
+                ellipse_centre.append(line.centre)
+                ellipse_r1.append(line.r1)
+                ellipse_r2.append(line.r2)
+                ellipse_lims.append((segment.low_lim, segment.up_lim))
+                ellipse_coil.append(i)
+
+    return {
+        'n_coils': len(coils),
+        'n_nodes': n_nodes,
+        'straight_start': np.array(straight_start, dtype=float).reshape(-1, 3),
+        'straight_end': np.array(straight_end, dtype=float).reshape(-1, 3),
+        'straight_coil': np.array(straight_coil, dtype=int),
+        'arc_centre': np.array(arc_centre, dtype=float).reshape(-1, 3),
+        'arc_r1': np.array(arc_r1, dtype=float).reshape(-1, 3),
+        'arc_r2': np.array(arc_r2, dtype=float).reshape(-1, 3),
+        'arc_lims': np.array(arc_lims, dtype=float).reshape(-1, 2),
+        'arc_coil': np.array(arc_coil, dtype=int),
+        'node_pos': np.array(node_pos, dtype=float).reshape(-1, 3),
+        'node_dl': np.array(node_dl, dtype=float).reshape(-1, 3),
+        'node_coil': np.array(node_coil, dtype=int),
+        'ellipse_centre': np.array(ellipse_centre, dtype=float).reshape(-1, 3),
+        'ellipse_r1': np.array(ellipse_r1, dtype=float).reshape(-1, 3),
+        'ellipse_r2': np.array(ellipse_r2, dtype=float).reshape(-1, 3),
+        'ellipse_lims': np.array(ellipse_lims, dtype=float).reshape(-1, 2),
+        'ellipse_coil': np.array(ellipse_coil, dtype=int),
+    }
+
+
+def node_B(pos : np.ndarray, dl : np.ndarray, x : np.ndarray, y : np.ndarray, z : np.ndarray) -> np.ndarray:
+    '''
+    Field of current elements dl located at pos (one quadrature node each), dl x (r - pos) / |r - pos|^3;
+    voxels coinciding with a node get no contribution from it
+    '''
+    sep_x, sep_y, sep_z = x - pos[0], y - pos[1], z - pos[2]
+    norm_sq = sep_x ** 2 + sep_y ** 2 + sep_z ** 2
+    inv_norm_3 = np.where(norm_sq > 0, norm_sq, np.inf) ** -1.5
+
+    return np.array([(dl[1] * sep_z - dl[2] * sep_y) * inv_norm_3,
+                     (dl[2] * sep_x - dl[0] * sep_z) * inv_norm_3,
+                     (dl[0] * sep_y - dl[1] * sep_x) * inv_norm_3])
+
+
+def refine_ellipses(geometry : dict, x : np.ndarray, y : np.ndarray, z : np.ndarray,
+                    B_field : np.ndarray, margin : float = 4.) -> np.ndarray:
+    '''
+    Replace the fixed-order node sum of every ellipse by adaptive_B for the voxels near it
+
+    The n_nodes Gauss-Legendre nodes of a segment are accurate to better than 1e-6 for voxels more
+    than a few node spacings from the wire (the error decays roughly like exp(-2 pi d / spacing)),
+    so only voxels within margin node spacings of an ellipse's nodes are recomputed, and their
+    node contribution is swapped for the adaptive one in place.
+
+    Parameters
+    ----------
+    geometry : dict
+        Packed segment geometry, as returned by pack_geometry
+    x : np.ndarray
+        X-coordinates of the voxels
+    y : np.ndarray
+        Y-coordinates of the voxels; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates of the voxels; must broadcast with x and y
+    B_field : np.ndarray
+        Array of shape (Nc, 3, *shape) holding the node sums, corrected in place
+    margin : float - Optional
+        Distance from the nodes, in node spacings, within which voxels are refined
+
+    Returns
+    -------
+    np.ndarray
+        B_field
+    '''
+    shape = B_field.shape[2:]
+    nodes, weights = gauss_legendre_nodes(geometry['n_nodes'])
+
+    for e, coil in enumerate(geometry['ellipse_coil']):
+        line = Curved(*geometry['ellipse_centre'][e], *geometry['ellipse_r1'][e], *geometry['ellipse_r2'][e])
+        low, up = geometry['ellipse_lims'][e]
+        half_len = (up - low) / 2
+        t_nodes = half_len * nodes + (up + low) / 2
+        pos = line.position(t_nodes)
+        dl = line.tangent(t_nodes) * half_len * weights
+        reach = margin * np.max(np.sqrt(np.sum(np.diff(pos, axis=1) ** 2, axis=0)))
+
+        # Only voxels inside the nodes' bounding box (grown by reach) can be near
+        lo, hi = pos.min(axis=1) - reach, pos.max(axis=1) + reach
+        in_box = np.broadcast_to((x >= lo[0]) & (x <= hi[0]) & (y >= lo[1]) & (y <= hi[1])
+                                 & (z >= lo[2]) & (z <= hi[2]), shape)
+        index = np.nonzero(in_box)
+        if len(index[0]) == 0:
+            continue
+        p_x, p_y, p_z = (np.broadcast_to(coord, shape)[index] for coord in (x, y, z))
+
+        dist_sq = ((p_x[:, None] - pos[0]) ** 2 + (p_y[:, None] - pos[1]) ** 2
+                   + (p_z[:, None] - pos[2]) ** 2)
+        near = np.min(dist_sq, axis=1) < reach ** 2
+        if not np.any(near):
+            continue
+        index = tuple(i[near] for i in index)
+        p_x, p_y, p_z = p_x[near], p_y[near], p_z[near]
+
+        node_sum = np.sum(node_B(pos[:, :, None], dl[:, :, None], p_x, p_y, p_z), axis=1)
+        adaptive = adaptive_B(low, up, line.position, line.tangent, p_x, p_y, p_z)
+        B_field[coil][(slice(None),) + index] += (adaptive - node_sum).astype(B_field.dtype)
+
+    return B_field
+
+
+def scanner_B(geometry : dict, x : np.ndarray, y : np.ndarray, z : np.ndarray,
+              max_elements : int = 2 ** 22, dtype : type = np.float64, backend : str = 'auto') -> np.ndarray:
+    '''
+    Evaluate the field of every coil in a scanner over a block of voxels in one vectorized pass
+
+    All segments of one kind are evaluated together by broadcasting the packed geometry (from
+    pack_geometry) along a leading axis, and their fields are summed into their coils with a single
+    matrix product against the coil membership; there is no per-segment Python loop. Only the
+    voxels close to an ellipse are then refined segment by segment (see refine_ellipses).
+
+    Parameters
+    ----------
+    geometry : dict
+        Packed segment geometry, as returned by pack_geometry
+    x : np.ndarray
+        X-coordinates at which to evaluate the field (e.g., an open grid vector of shape (Nx, 1, 1))
+    y : np.ndarray
+        Y-coordinates at which to evaluate the field; must broadcast with x and z
+    z : np.ndarray
+        Z-coordinates at which to evaluate the field; must broadcast with x and y
+    max_elements : int - Optional
+        Upper bound on segments x voxels evaluated at once; segments are processed in chunks
+        so that temporary memory stays bounded
+    dtype : type - Optional
+        Floating point type of the straight and node kernels and of the accumulated result. With
+        np.float32 the relative error of a voxel's field is about 1e-7 * |r| / d, with |r| the
+        distance of the voxel from the origin and d its distance from the nearest conductor; for
+        the head coil configuration every voxel stays within 2e-6 of its coil's peak field. Arcs
+        are always evaluated in double precision, since scipy's elliptic integrals are, and cast
+        afterwards
+    backend : str - Optional
+        'numpy' for the vectorized NumPy kernels, 'jit' for the fused, multithreaded Numba kernel
+        of straight segments and nodes (see jit_kernels; arcs still use arc_B), or 'auto' (default)
+        to use the JIT when Numba is installed and the coordinates are an open grid
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (Nc, 3, *shape) of the x, y, and z field components of every coil
+    '''
+    if backend not in ('auto', 'numpy', 'jit'):
+        raise ValueError('Unknown backend: ' + str(backend))
+    if backend == 'jit' and not jit_kernels.available:
+        raise ValueError('The jit backend requires numba')
+
+    shape = np.broadcast_shapes(np.shape(x), np.shape(y), np.shape(z))
+    n_coils = geometry['n_coils']
+    B_field = np.zeros((n_coils, 3) + shape, dtype=dtype)
+    x_t, y_t, z_t = (np.asarray(coord, dtype=dtype) for coord in (x, y, z))
+
+    chunk = max(1, max_elements // max(1, int(np.prod(shape))))
+    # (k, 3) geometry -> (3, k, 1, ..., 1) so it broadcasts against the voxel block
+    expand = (slice(None), slice(None)) + (None,) * len(shape)
+    lims_expand = (slice(None),) + (None,) * len(shape)
+
+    def accumulate(coil_index, field):
+        membership = (np.arange(n_coils)[:, None] == coil_index[None, :]).astype(dtype)
+        B_field[...] += np.tensordot(membership, field.astype(dtype, copy=False), axes=([1], [1]))
+
+    vectors = jit_kernels.open_vectors(x_t, y_t, z_t) if backend != 'numpy' and jit_kernels.available else None
+    if backend == 'jit' and vectors is None:
+        raise ValueError('The jit backend requires open grid coordinates')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if vectors is not None:
+            # Straight segments and nodes in one fused loop, accumulated in place
+            packed = [np.ascontiguousarray(geometry[key], dtype=dtype)
+                      for key in ('straight_start', 'straight_end', 'node_pos', 'node_dl')]
+            jit_kernels.fused_B(*vectors, packed[0], packed[1], geometry['straight_coil'],
+                                packed[2], packed[3], geometry['node_coil'], B_field)
+        else:
+            for i in range(0, len(geometry['straight_coil']), chunk):
+                part = slice(i, i + chunk)
+                accumulate(geometry['straight_coil'][part],
+                           straight_B(geometry['straight_start'][part].T[expand].astype(dtype),
+                                      geometry['straight_end'][part].T[expand].astype(dtype), x_t, y_t, z_t))
+
+            for i in range(0, len(geometry['node_coil']), chunk):
+                part = slice(i, i + chunk)
+                accumulate(geometry['node_coil'][part],
+                           node_B(geometry['node_pos'][part].T[expand].astype(dtype),
+                                  geometry['node_dl'][part].T[expand].astype(dtype), x_t, y_t, z_t))
+
+        for i in range(0, len(geometry['arc_coil']), chunk):
+            part = slice(i, i + chunk)
+            lims = geometry['arc_lims'][part]
+            accumulate(geometry['arc_coil'][part],
+                       arc_B(geometry['arc_centre'][part].T[expand], geometry['arc_r1'][part].T[expand],
+                             geometry['arc_r2'][part].T[expand], lims[:, 0][lims_expand],
+                             lims[:, 1][lims_expand], x, y, z))
+
+    refine_ellipses(geometry, x, y, z, B_field)
+
+    return B_field
+
+
+def split_geometry(geometry : dict, n_parts : int) -> list[tuple[np.ndarray, dict]]:
+    '''
+    Split packed geometry into parts of roughly equal cost for parallel evaluation
+
+    Segments are ordered by coil and cut into contiguous runs, so a part usually covers whole coils
+    and only the heaviest coils are split across parts (their fields are summed back afterwards).
+    Each part only holds the coils it touches, renumbered from zero.
+
+    Parameters
+    ----------
+    geometry : dict
+        Packed segment geometry, as returned by pack_geometry
+    n_parts : int
+        Desired number of parts (fewer are returned if there are fewer segments)
+
+    Returns
+    -------
+    list[tuple[np.ndarray, dict]]
+        For each part, the original indices of its coils and its packed geometry
+    '''
+    # (coil, kind, index, relative cost) of every packed entry; elliptic integrals are the dearest
+    kinds = {'straight': ('straight_coil', 1.), 'arc': ('arc_coil', 4.), 'node': ('node_coil', 0.5),
+             'ellipse': ('ellipse_coil', 4.)}
+    entries = []
+    for kind, (key, cost) in kinds.items():
+        entries.extend((coil, kind, i, cost) for i, coil in enumerate(geometry[key]))
+    entries.sort(key=lambda entry: (entry[0], entry[1], entry[2]))
+
+    if len(entries) == 0:
+        return []
+
+    n_parts = max(1, min(n_parts, len(entries)))
+    target = sum(entry[3] for entry in entries) / n_parts
+    runs, run, run_cost = [], [], 0.
+    for entry in entries:
+        run.append(entry)
+        run_cost += entry[3]
+        if run_cost >= target and len(runs) < n_parts - 1:
+            runs.append(run)
+            run, run_cost = [], 0.
+    if run:
+        runs.append(run)
+
+    fields = {
+        'straight': ('straight_start', 'straight_end'),
+        'arc': ('arc_centre', 'arc_r1', 'arc_r2', 'arc_lims'),
+        'node': ('node_pos', 'node_dl'),
+        'ellipse': ('ellipse_centre', 'ellipse_r1', 'ellipse_r2', 'ellipse_lims'),
+    }
+    parts = []
+    for run in runs:
+        coil_ids = np.unique([entry[0] for entry in run])
+        part = {'n_coils': len(coil_ids), 'n_nodes': geometry['n_nodes']}
+        for kind, (key, _) in kinds.items():
+            index = np.array([entry[2] for entry in run if entry[1] == kind], dtype=int)
+            for field in fields[kind]:
+                part[field] = geometry[field][index]
+            part[key] = np.searchsorted(coil_ids, geometry[key][index])
+        parts.append((coil_ids, part))
+
+    return parts
+
+
+def sensitivity(B_field : np.ndarray) -> np.ndarray:
+    '''
+    Complex coil sensitivity Bx - i By from field components (the axis of size 3 is the fourth from last)
+    '''
+    return B_field[..., 0, :, :, :] - 1j * B_field[..., 1, :, :, :]
+
+
+def combined_maps(sensitivities : np.ndarray, maps : tuple = ('rss', 'max_coil'),
+                  noise_cov : np.ndarray = None) -> dict:
+    '''
+    Combine the sensitivities of all coils voxel by voxel
+
+    Parameters
+    ----------
+    sensitivities : np.ndarray
+        Complex array of shape (Nc, ...) of the sensitivity of every coil (e.g., over one slab)
+    maps : tuple, optional
+        Combined maps to compute, any of:
+        'rss' - root-sum-of-squares magnitude, sqrt(sum_c |S_c|^2)
+        'roemer' - relative SNR of the optimal (Roemer) combination, sqrt(S^H Psi^-1 S), where Psi is
+        the noise covariance of the coils; equal to 'rss' for uncorrelated noise of equal variance
+        'max_coil' - index of the coil with the largest |S_c|
+    noise_cov : np.ndarray, optional
+        (Nc, Nc) Hermitian noise covariance Psi of the coils; defaults to the identity
+
+    Returns
+    -------
+    dict
+        Map name -> array of shape sensitivities.shape[1:] (real for 'rss' and 'roemer', int16 or
+        int32 for 'max_coil')
+
+    Raises
+    ------
+    ValueError
+        If an unknown map is requested, or noise_cov does not match the number of coils
+    '''
+    unknown = [name for name in maps if name not in ('rss', 'roemer', 'max_coil')]
+    if unknown:
+        raise ValueError('Unknown combined map(s) ' + ', '.join(unknown) + "; maps should be 'rss', 'roemer', or 'max_coil'")
+    n_coils = sensitivities.shape[0]
+    if noise_cov is not None and np.shape(noise_cov) != (n_coils, n_coils):
+        raise ValueError('noise_cov must be of shape (' + str(n_coils) + ', ' + str(n_coils) + ')')
+
+    combined = {}
+    magnitude_2 = sensitivities.real ** 2 + sensitivities.imag ** 2
+    if 'rss' in maps:
+        combined['rss'] = np.sqrt(magnitude_2.sum(axis=0))
+    if 'roemer' in maps and noise_cov is None:
+        combined['roemer'] = combined['rss'] if 'rss' in combined else np.sqrt(magnitude_2.sum(axis=0))
+    elif 'roemer' in maps:
+        weighted = np.tensordot(np.linalg.inv(noise_cov).astype(sensitivities.dtype), sensitivities, axes=1)
+        combined['roemer'] = np.sqrt(np.maximum((sensitivities.conj() * weighted).real.sum(axis=0), 0))
+    if 'max_coil' in maps:
+        combined['max_coil'] = np.argmax(magnitude_2, axis=0).astype(np.int16 if n_coils <= 2 ** 15 else np.int32)
+
+    return combined
+
+
+def _part_worker(geometry : dict, x : np.ndarray, y : np.ndarray, z : np.ndarray,
+                 transform : callable = None, dtype : type = np.float64) -> np.ndarray:
+    '''
+    Process pool entry point: evaluate one part of the geometry over one tile
+    '''
+    B_field = scanner_B(geometry, x, y, z, dtype=dtype)
+    return transform(B_field) if transform is not None else B_field
+
+
+def process_pool(workers : int = None) -> ProcessPoolExecutor:
+    '''
+    Pool of worker processes for parallel_B, sharing the CPUs between their JIT threads (no-op
+    without Numba)
+
+    Starting a pool is expensive (every process imports NumPy, SciPy, ... again, notably on Windows),
+    so a caller evaluating many volumes in a row (e.g., an export slab by slab) should create one and
+    pass it to each parallel_B call; shut it down (or use it as a context manager) when done
+    '''
+    workers = workers if workers is not None else os.cpu_count()
+    return ProcessPoolExecutor(max_workers=workers, initializer=jit_kernels.limit_threads,
+                               initargs=(max(1, (os.cpu_count() or 1) // workers),))
+
+
+def parallel_B(geometry : dict, x_dim : np.ndarray, y_dim : np.ndarray, z_dim : np.ndarray,
+               tile : tuple = None, workers : int = None, out : np.ndarray = None,
+               transform : callable = None, dtype : type = np.float64,
+               executor : ProcessPoolExecutor = None) -> np.ndarray:
+    '''
+    Evaluate the field of every coil over a voxel grid with a pool of worker processes
+
+    The work is partitioned by tile (e.g., z-slab) and, when there are fewer tiles than needed to
+    keep every worker busy, additionally by coil and segment (see split_geometry). Each task runs
+    scanner_B in its own process on picklable arrays only, and each tile is written into the output
+    once all of its parts are done (summed in memory where a coil was split across parts), so the
+    output can be a memory-mapped file or a chunked dataset that is filled slab by slab. Only about
+    two tasks per worker are in flight at a time, which bounds the memory held by results waiting
+    to be written.
+
+    Parameters
+    ----------
+    geometry : dict
+        Packed segment geometry, as returned by pack_geometry
+    x_dim : np.ndarray
+        1D coordinate vector along x
+    y_dim : np.ndarray
+        1D coordinate vector along y
+    z_dim : np.ndarray
+        1D coordinate vector along z
+    tile : tuple, optional
+        Number of voxels per tile along x, y, and z (None for the full extent)
+    workers : int, optional
+        Number of worker processes; defaults to the number of CPUs
+    out : np.ndarray, optional
+        Array to write the result into, of shape (Nc, 3, Nx, Ny, Nz) or the transformed shape
+    transform : callable, optional
+        Module-level function applied (in the worker) to each (n, 3, bx, by, bz) field block before
+        it is returned, e.g. sensitivity; must be linear since split coils are summed afterwards
+    dtype : type, optional
+        Floating point type of the calculation (see scanner_B)
+    executor : ProcessPoolExecutor, optional
+        Pool to run the tasks on (see process_pool), left running afterwards; by default a pool of
+        workers processes is started and shut down within the call
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (Nc, 3, Nx, Ny, Nz) of the x, y, and z field components of every coil, or
+        the transformed result
+    '''
+    workers = workers if workers is not None else os.cpu_count()
+    dims = (len(x_dim), len(y_dim), len(z_dim))
+    tile = tile if tile is not None else (None, None, None)
+    steps = [max(1, step) if step is not None else max(1, dim) for step, dim in zip(tile, dims)]
+
+    if out is None:
+        # Probe the transform on a single voxel for the output layout and dtype
+        probe = np.zeros((1, 3, 1, 1, 1), dtype=dtype)
+        probe = probe if transform is None else transform(probe)
+        out = np.zeros((geometry['n_coils'],) + probe.shape[1:-3] + dims, dtype=probe.dtype)
+
+    tiles = [(slice(i, i + steps[0]), slice(j, j + steps[1]), slice(k, k + steps[2]))
+             for i in range(0, dims[0], steps[0])
+             for j in range(0, dims[1], steps[1])
+             for k in range(0, dims[2], steps[2])]
+    # Aim for a few tasks per worker so uneven tasks still balance
+    parts = split_geometry(geometry, -(-4 * workers // len(tiles)))
+
+    # Tasks are submitted tile by tile and at most two per worker are in flight, so the parent never
+    # holds more than a few finished blocks (and partial tile sums) that still have to be written
+    tasks = ((coil_ids, part, t) for t in range(len(tiles)) for coil_ids, part in parts)
+    # The parts of a tile are summed in memory, and the tile is written into out once all of them are
+    # in (coils without any segments are left at zero), so every region of out is written exactly
+    # once: out need not be zeroed beforehand, and a chunked, compressed output (see export_formats)
+    # compresses each chunk once
+    sums, remaining = {}, {}
+    if not parts:
+        out[...] = 0
+    pool = executor if executor is not None else process_pool(workers)
+    pending = {}
+    try:
+        while True:
+            for coil_ids, part, t in islice(tasks, 2 * workers - len(pending)):
+                xs, ys, zs = tiles[t]
+                future = pool.submit(_part_worker, part, x_dim[xs, None, None],
+                                     y_dim[None, ys, None], z_dim[None, None, zs], transform, dtype)
+                pending[future] = (coil_ids, t)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                coil_ids, t = pending.pop(future)
+                block = future.result()
+                if t not in sums:
+                    sums[t] = np.zeros((geometry['n_coils'],) + block.shape[1:], dtype=block.dtype)
+                    remaining[t] = len(parts)
+                sums[t][coil_ids] += block
+                remaining[t] -= 1
+                if remaining[t] == 0:
+                    xs, ys, zs = tiles[t]
+                    out[..., xs, ys, zs] = sums.pop(t)
+                    del remaining[t]
+                del future, block
+    finally:
+        # Tasks still queued after an error would otherwise keep a shared pool busy
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown()
+
+    return out
@@ -1,11 +1,11 @@
-import sympy as smp
 import matplotlib.pyplot as plt
 import numpy as np
-import sympy as smp
 import matplotlib.quiver as mquiver
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from segment import Segment
 import sim_utils
 import b_calculation
+import field_cache
 
 from typing import TYPE_CHECKING
 
@@ -29,10 +29,20 @@ class Coil:
     -------
     plot_coil(self, ax : plt.axes) -> bool
         Plots coil on passed axis; True if successful
+    get_polylines(self) -> list[np.ndarray]
+        Points along every segment, for plotting
+    get_arrows(self) -> np.ndarray
+        Midpoints and directions of every segment, for plotting
     add_segment(self, segment : Segment) -> bool
         Adds segment that forms (a part of) the coil; True if successful
     B_volume(self) -> np.ndarray
         Calculate magnetic field at every point in self.scanner.bbox volume resulting from coil
+    volume_key(self) -> tuple
+        Key identifying the geometry, bounding box, and volume resolution self.B_vol depends on
+    update_mag_vol(self)
+        Updates self.B_vol to reflect the current B_volume
+    get_B_slice(self, slice : str, slice_loc : int) -> np.ndarray | None
+        View of self.B_vol over a slice (no copy); None if self.B_vol is out of date
     '''
 
     def __init__(self, segments : list[Segment] = None, scanner : 'Scanner' = None):
@@ -53,6 +63,7 @@ class Coil:
         self.scanner = None
         self.set_scanner(scanner) # Link coil to its 'parent' scanner - for access to self.scanner.bbox, self.scanner.vol_res, etc.
         self.B_vol = None # For entire area -> should only be calculated on export (i.e., not during prototyping due to computational demands)
+        self.B_vol_key = None # volume_key() that self.B_vol was computed for
         self.B_vol_slice = None # For 'visible' slice (i.e., selected slice) -> should be updated everytime the slice is changed
 
     def set_scanner(self, scanner : 'Scanner'):
@@ -95,23 +106,48 @@ class Coil:
             If plotting is complete without problems
         '''
 
-        for segment in self.segments:
-
-            x_coords, y_coords, z_coords = segment.get_coords()
+        if len(self.segments) == 0:
+            return True
 
-            ax.plot(x_coords, y_coords, z_coords, color = seg_color, lw = 2)
+        # One collection for all segments, and one quiver for all of their direction arrows
+        ax.add_collection3d(Line3DCollection(self.get_polylines(), colors = seg_color, linewidths = 2))
 
-            # Add an arrow to the midpoint to give the direction
-            n = len(x_coords) // 2
-            o = n + 1
-            ax.quiver(
-                x_coords[n], y_coords[n], z_coords[n],
-                x_coords[o] - x_coords[n], y_coords[o] - y_coords[n], z_coords[o] - z_coords[n],
-                color = 'black', pivot = 'middle', length = 5
-            )
+        arrows = self.get_arrows()
+        ax.quiver(*arrows.T, color = 'black', pivot = 'middle', length = 5)
 
         return True
 
+    def get_polylines(self) -> list[np.ndarray]:
+        '''
+        Get points along every segment of the coil, for plotting (see Segment.get_polyline)
+
+        Returns
+        -------
+        list[np.ndarray]
+            One array of shape (n_points, 3) per segment
+        '''
+
+        return [segment.get_polyline() for segment in self.segments]
+
+    def get_arrows(self) -> np.ndarray:
+        '''
+        Get the arrows giving the direction of every segment of the coil, for plotting
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (n_segments, 6) of the x-, y-, and z-coordinates of each segment's midpoint
+            followed by the x-, y-, and z-components of the step to the next point along the segment
+        '''
+
+        arrows = np.empty((len(self.segments), 6))
+        for i, polyline in enumerate(self.get_polylines()):
+            n = len(polyline) // 2
+            arrows[i, :3] = polyline[n]
+            arrows[i, 3:] = polyline[n + 1] - polyline[n]
+
+        return arrows
+
     def add_segment(self, segment : Segment):
         '''
         Validate and append a passed segment to the coil attribute segments
@@ -135,7 +171,7 @@ class Coil:
 
         # self.update_mag_vol()
 
-    def B_volume(self) -> np.ndarray:
+    def B_volume(self, n_nodes : int = 64, tile : tuple = None) -> np.ndarray:
         ''' 
         Calculate the B field at every point in a volume resulting from a coil
 
@@ -144,24 +180,52 @@ class Coil:
         point within a defined volume. The volume is bounded by a self.scanner.bbox and space
         is discretized based on the volume resolution.
 
+        The on-disk field cache (see field_cache.default_disk_cache) is consulted first, so a coil
+        whose volume was computed before, in any session or workspace, is memory-mapped instead.
+
+        Parameters
+        ----------
+        n_nodes : int, optional
+            Number of Gauss-Legendre nodes used for segments without a closed-form solution
+        tile : tuple, optional
+            Number of voxels per tile along x, y, and z (see b_calculation.tiled_B)
+
         Returns
         -------
         np.ndarray
-            4D volume of magnetic field components at each point in space. Last 
+            4D volume of magnetic field components at each point in space. First
             dimension is size 3 representing x, y, and z components
         '''
 
-        B_fields = []
+        disk_cache = field_cache.default_disk_cache()
+        if disk_cache is not None:
+            key = disk_cache.key('coil', self.volume_key(), 'scanner', n_nodes)
+            B_vol = disk_cache.get(key)
+            if B_vol is not None:
+                return B_vol
+
+        x_dim, y_dim, z_dim = b_calculation.grid_axes(self.scanner.get_bbox(), self.scanner.get_vol_res())
+        geometry = b_calculation.pack_geometry([self], n_nodes)
 
-        for segment in self.segments:
-            B_fields.append(segment.seg_B)
+        B_vol = b_calculation.tiled_B(lambda x, y, z: b_calculation.scanner_B(geometry, x, y, z),
+                                      x_dim, y_dim, z_dim, tile)[0]
+        return disk_cache.put(key, B_vol) if disk_cache is not None else B_vol
+
+    def volume_key(self) -> tuple:
+        '''
+        Key identifying everything self.B_vol depends on (the geometry of the segments, the bounding
+        box, and the volume resolution); self.B_vol is out of date whenever it differs from self.B_vol_key
+        '''
 
-        return sum(B_fields)
+        return (tuple(sorted(segment.geometry_key() for segment in self.segments)),
+                tuple(self.scanner.get_bbox()), tuple(self.scanner.get_vol_res()))
 
     def update_mag_vol(self):
         '''
         Updates self.B_vol to reflect the current B_volume
 
+        The volume is made read-only since slices of it are handed out as views (see get_B_slice)
+
         Parameters
         ----------
         None
@@ -173,7 +237,38 @@ class Coil:
         '''
 
         if len(self.segments) > 0 and self.scanner is not None:
-            self.B_vol = self.B_volume()
+            key = self.volume_key()
+            B_vol = self.B_volume()
+            B_vol.flags.writeable = False
+            self.B_vol, self.B_vol_key = B_vol, key
+
+    def get_B_slice(self, slice : str, slice_loc : int) -> np.ndarray | None:
+        '''
+        Get the field over a slice as a view of self.B_vol (no copy)
+
+        The slice axis is kept (with size 1) so the result has the same shape as a field computed over
+        the slice volume
+
+        Parameters
+        ----------
+        slice : str
+            Slice axis ('x', 'y', or 'z')
+        slice_loc : int
+            Slice number (starting at 1)
+
+        Returns
+        -------
+        np.ndarray | None
+            Array of shape (3, 1, Ny, Nz), (3, Nx, 1, Nz), or (3, Nx, Ny, 1); None if self.B_vol is
+            missing or out of date
+        '''
+
+        if self.B_vol is None or self.scanner is None or self.B_vol_key != self.volume_key():
+            return None
+
+        index = [np.s_[:]] * 4 # (the builtin slice is shadowed by the parameter)
+        index['xyz'.index(slice) + 1] = np.s_[slice_loc - 1:slice_loc]
+        return self.B_vol[tuple(index)]
 
     def update_B_vol_slice(self, volume_coords : list):
         '''
@@ -1,7 +1,14 @@
 from math import sqrt
+from collections import Counter
+import os
 import numpy as np
 import json
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 from gui import MainWindow
 
 from scanner import Scanner
@@ -9,47 +16,306 @@ from coil import Coil
 from lines import Straight, Curved
 from segment import Segment
 from encoder import CustomEncoder
+import encoder
+from field_cache import FieldCache
+import field_cache
 import sim_utils
+import b_calculation
+import export_formats
 
 import matplotlib.pyplot as plt
 import matplotlib as mpl
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection, Line3DCollection
 from matplotlib.patches import Polygon
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from PyQt5.QtCore import QThread
+from PyQt5.QtCore import QThread, QThreadPool, QRunnable, QObject, pyqtSignal
 from PyQt5 import QtGui
 
+def available_memory(fallback : int = 2 ** 30) -> int:
+    '''
+    Estimate the memory (in bytes) available to new allocations
+
+    Uses psutil when it is installed, the number of free physical pages where the OS reports it,
+    and fallback otherwise
+    '''
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return fallback
+
+
+def consecutive_runs(indices : list) -> list:
+    '''
+    Split sorted indices into runs of consecutive ones, e.g. [0, 1, 2, 5, 6] -> [(0, 3), (5, 7)]
+
+    Returns
+    -------
+    list
+        (start, stop) pairs such that each run is range(start, stop)
+    '''
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index:
+            runs[-1] = (runs[-1][0], index + 1)
+        else:
+            runs.append((index, index + 1))
+    return runs
+
+
 class exportVolThread(QThread):
-    def __init__(self, export_file, scanner, controller):
+
+    TILE = (None, None, 8) # Evaluate the volume in z-slabs of 8 planes to bound peak memory
+    # Export dtype -> float type of the calculation (complex64 is computed in float32, see scanner_B)
+    PRECISIONS = {'complex128': np.float64, 'complex64': np.float32}
+    N_NODES = 64 # Gauss-Legendre nodes for segments without a closed-form solution (see Scanner.sensitivity_volume)
+    CACHE_COIL_BYTES = 64 * 2 ** 20 # Largest coil copied into the on-disk field cache after an export
+
+    def __init__(self, export_file, scanner, controller, tile : tuple = TILE, workers : int = None,
+                 precision : str = 'complex128', format : str = 'npy', coil_maps : bool = True,
+                 combined : tuple = (), noise_cov : np.ndarray = None):
         QThread.__init__(self)
         self.controller = controller # FIXME
         self.controller.scanner
         self.scanner = scanner
         self.export_file = export_file
+        self.tile = tile
+        self.workers = workers # Number of worker processes; None uses every CPU
+        if precision not in self.PRECISIONS:
+            raise ValueError('Export precision must be one of ' + ', '.join(self.PRECISIONS))
+        self.precision = precision
+        if format != 'npy' and format not in export_formats.available:
+            raise ValueError('Export format must be one of ' + ', '.join(['npy'] + export_formats.available))
+        self.format = format # 'npy', or a chunked, compressed format (see export_formats)
+        # Combined maps to export (see b_calculation.combined_maps); a scanner without coils has nothing to combine
+        self.combined = tuple(combined) if len(scanner.coils) > 0 else ()
+        if not coil_maps and not self.combined:
+            raise ValueError('Nothing to export; request the per-coil maps, combined maps, or both, of at least one coil')
+        self.coil_maps = coil_maps # Whether to export the sensitivity of every coil
+        self.noise_cov = noise_cov # Noise covariance of the coils for the 'roemer' map; None for the identity
+        # Probe the combination on a single voxel for the type of each map (also validates the request)
+        self.combined_dtypes = {}
+        if self.combined:
+            self.combined_dtypes = {name: array.dtype for name, array in b_calculation.combined_maps(
+                np.zeros((len(scanner.coils), 1), dtype=precision), self.combined, noise_cov).items()}
+
+    def open_export(self, shape : tuple) -> tuple:
+        '''
+        Create the export file(s)
+
+        Returns
+        -------
+        tuple
+            (array of the given shape to fill with the per-coil maps, or None if they are not exported,
+            dict of the arrays to fill with each combined map, function finishing the file(s))
+        '''
+        export_file = str(self.export_file)
+        if self.format != 'npy':
+            return export_formats.create(export_formats.export_path(export_file, self.format), self.format,
+                                         self.scanner, self.precision, slab=self.tile[2] if self.tile else None,
+                                         coil_maps=self.coil_maps, combined=self.combined_dtypes)
+
+        # Same .npy file np.save would write, but filled slab by slab through a memory map so the
+        # full (Nc, Nx, Ny, Nz) array is never held in RAM; each combined map goes to its own file
+        # (e.g., export_rss.npy next to export.npy)
+        base = export_file[:-len('.npy')] if export_file.endswith('.npy') else export_file
+        export_array = (np.lib.format.open_memmap(base + '.npy', mode='w+', dtype=self.precision, shape=shape)
+                        if self.coil_maps else None)
+        combined_arrays = {name: np.lib.format.open_memmap(base + '_' + name + '.npy', mode='w+', dtype=dtype,
+                                                           shape=shape[1:])
+                           for name, dtype in self.combined_dtypes.items()}
+        arrays = ([export_array] if export_array is not None else []) + list(combined_arrays.values())
+        return export_array, combined_arrays, lambda: [array.flush() for array in arrays]
 
     def get_seg_B(self):
-        tmp = []
-        for i in range(0, len(self.scanner.coils)):
-            for segment in self.scanner.coils[i].segments:
-                segment.seg_B = segment.calc_seg_B(self.scanner.get_bbox())
-            self.scanner.coils[i].update_mag_vol()
-            B_field = self.scanner.coils[i].B_vol
-            B_complex = B_field[0, :, :, :] - 1j * B_field[1, :, :, :]  
-            print(B_complex)
-            tmp.append(B_complex)
-        print(tmp)
-        export_array = np.array(tmp)
-        print(export_array)
-        np.save(self.export_file, export_array) 
+        dims = tuple(len(dim) for dim in b_calculation.grid_axes(self.scanner.bbox, self.scanner.vol_res))
+        shape = (len(self.scanner.coils),) + dims
+
+        export_array, combined_arrays, finish = self.open_export(shape)
+        slab = self.tile[2] if self.tile and self.tile[2] else dims[2]
+        coil_bytes = int(np.prod(dims)) * np.dtype(self.precision).itemsize
+
+        # Coils exported before (in any session or workspace) are read from the on-disk field cache; the
+        # others are computed in runs of consecutive coils
+        disk_cache = field_cache.default_disk_cache()
+        cached = {}
+        if disk_cache is not None:
+            keys = [disk_cache.key('sensitivity', coil.volume_key(), 'scanner', self.N_NODES, self.precision)
+                    for coil in self.scanner.coils]
+            for i, key in enumerate(keys):
+                cached_array = disk_cache.get(key)
+                if cached_array is not None and cached_array.shape == shape[1:]:
+                    cached[i] = cached_array
+        runs = consecutive_runs([i for i in range(len(self.scanner.coils)) if i not in cached])
+        # One pool of worker processes serves every run and slab of the export
+        executor = b_calculation.process_pool(self.workers) if self.workers != 1 and runs else None
+
+        try:
+            if not self.combined:
+                # Each run is computed straight into the export
+                for i, cached_array in cached.items():
+                    for k in range(0, dims[2], slab):
+                        export_array[i, :, :, k:k + slab] = cached_array[:, :, k:k + slab]
+                for start, stop in runs:
+                    self.scanner.sensitivity_volume(n_nodes=self.N_NODES, tile=self.tile, workers=self.workers,
+                                                    out=export_array[start:stop], dtype=self.PRECISIONS[self.precision],
+                                                    coils=self.scanner.coils[start:stop], executor=executor)
+            else:
+                # Every coil is computed one z-slab at a time, so the combined maps can be accumulated from each
+                # slab as soon as it is done, without ever reading back (or, if not exported, writing) the coils
+                for k in range(0, dims[2], slab):
+                    planes = slice(k, min(k + slab, dims[2]))
+                    sensitivities = np.empty(shape[:3] + (planes.stop - k,), dtype=self.precision)
+                    for i, cached_array in cached.items():
+                        sensitivities[i] = cached_array[:, :, planes]
+                    for start, stop in runs:
+                        self.scanner.sensitivity_volume(n_nodes=self.N_NODES, tile=self.tile, workers=self.workers,
+                                                        out=sensitivities[start:stop], dtype=self.PRECISIONS[self.precision],
+                                                        coils=self.scanner.coils[start:stop], planes=planes,
+                                                        executor=executor)
+
+                    if export_array is not None:
+                        export_array[:, :, :, planes] = sensitivities
+                    for name, array in b_calculation.combined_maps(sensitivities, self.combined, self.noise_cov).items():
+                        combined_arrays[name][:, :, planes] = array
+
+            # Coils are only cached from a .npy export (reading them back from a compressed file would decompress
+            # every coil again), and only if small: caching reads each coil back from the export and writes it a
+            # second time, which for large coils would double the export's I/O for a cache they soon outgrow
+            if (disk_cache is not None and export_array is not None and self.format == 'npy'
+                    and coil_bytes <= min(disk_cache.max_bytes, self.CACHE_COIL_BYTES)):
+                for start, stop in runs:
+                    for i in range(start, stop):
+                        disk_cache.put(keys[i], np.asarray(export_array[i]))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            finish()
+        del export_array, combined_arrays
 
     def run(self):
         self.get_seg_B()
         self.controller.enable_export_btn()
 
+
+class sliceFieldSignals(QObject):
+
+    preview = pyqtSignal(int, object) # (generation, coarse field of the whole coil over the slice)
+    ready = pyqtSignal(int, object) # (generation, {geometry key: field over the slice})
+    volume = pyqtSignal(int, object) # (generation, (coil, volume key, field over the whole volume))
+
+
+class sliceFieldTask(QRunnable):
+    '''
+    Worker computing the fields of the segments needed for the displayed slice
+
+    If a preview is requested, a quick coarse field of the whole coil is reported first through signals.preview.
+    Results are reported back to the GUI thread through signals.ready; the task stops early (and reports nothing)
+    once the controller issues a newer slice request
+    '''
+
+    def __init__(self, controller, generation : int, scanner, segments : dict, slice : str, slice_loc : int,
+                 preview : tuple = None):
+        QRunnable.__init__(self)
+        self.controller = controller
+        self.generation = generation
+        self.scanner = scanner
+        self.segments = segments
+        self.slice = slice
+        self.slice_loc = slice_loc
+        self.preview = preview # (keys, segments, known fields) of the whole coil, or None for no preview
+        self.signals = controller.slice_signals
+
+    def run(self):
+        fields = {}
+        try:
+            if self.preview is not None:
+                keys, segments, known = self.preview
+                B_preview = sum(count * (known[key] if key in known else
+                                         self.controller.get_seg_B_slice_preview(segments[key], self.slice, self.slice_loc, self.scanner))
+                                for key, count in keys.items())
+                if self.controller.slice_generation != self.generation:
+                    return
+                self.signals.preview.emit(self.generation, B_preview)
+
+            for key, segment in self.segments.items():
+                if self.controller.slice_generation != self.generation:
+                    return
+                fields[key] = self.controller.get_seg_B_slice(segment, self.slice, self.slice_loc, self.scanner)
+        except Exception as e:
+            print('Error computing slice fields')
+            print(e)
+            return
+        self.signals.ready.emit(self.generation, fields)
+
+
+class prefetchSliceTask(QRunnable):
+    '''
+    Background task computing the fields of segments over a slice into the controller's slice cache
+
+    The task gives up as soon as the controller starts a newer prefetch generation (i.e., the focus coil,
+    the slice, or the scanner changed)
+    '''
+
+    def __init__(self, controller, generation : int, scanner, segments : list, slice : str, slice_loc : int):
+        QRunnable.__init__(self)
+        self.controller = controller
+        self.generation = generation
+        self.scanner = scanner
+        self.segments = segments
+        self.slice = slice
+        self.slice_loc = slice_loc
+
+    def run(self):
+        QThread.currentThread().setPriority(QThread.LowestPriority)
+        try:
+            for segment in self.segments:
+                if self.controller.prefetch_generation != self.generation:
+                    return
+                self.controller.get_seg_B_slice(segment, self.slice, self.slice_loc, self.scanner)
+        except Exception:
+            return # Only a speculative result is lost; the slice is computed again if it is ever requested
+
     
 
+class coilVolumeTask(QRunnable):
+    '''
+    Worker computing the whole volume of the focus coil (see Controller.request_coil_volume)
+
+    The result is handed to the GUI thread through signals.volume, which stores it in the coil, unless the
+    request was superseded in the meantime
+    '''
+
+    TILE = (None, None, 8) # Evaluate the volume in z-slabs of 8 planes to bound the temporaries
+
+    def __init__(self, controller, generation : int, coil : Coil, key : tuple):
+        QRunnable.__init__(self)
+        self.controller = controller
+        self.generation = generation
+        self.coil = coil
+        self.key = key # coil.volume_key() when the request was made
+        self.signals = controller.slice_signals
+
+    def run(self):
+        QThread.currentThread().setPriority(QThread.LowPriority)
+        try:
+            B_vol = self.coil.B_volume(tile=self.TILE)
+        except Exception as error:
+            print('Coil volume calculation failed:', error)
+            return
+        if self.controller.volume_generation == self.generation:
+            self.signals.volume.emit(self.generation, (self.coil, self.key, B_vol))
+
+
 class Controller:
 
+    # Largest share of the available memory the focus coil's whole volume may take (see use_volume)
+    VOLUME_MEMORY_FRACTION = 0.25
+    # Combined maps exported when 'Export Maps' includes them (see b_calculation.combined_maps); 'roemer' equals 'rss'
+    # without a noise covariance, so it is only of use when exporting programmatically (exportVolThread's noise_cov)
+    EXPORT_COMBINED = ('rss', 'max_coil')
+
     def __init__(self, view : MainWindow):
         self.view = view
         self.scanner = None
@@ -58,10 +324,50 @@ class Controller:
         self.editing = False
         self.user_inputs = []
         self.file = None
+        self.fields_file = None # File name of the workspace's field sidecar (see encoder.save_fields)
         self.slice = self.view.tr_w.slice_combo_btn.currentText()
         self.num_slices = None
         self.slice_loc = 1
         self.slice_B_vol = None
+        self.slice_cache = FieldCache() # Per-segment slice fields, keyed by geometry, slice, bbox, and vol_res
+        self.slice_view = None # (coil, slice, slice_loc, bbox, vol_res) that self.slice_B_vol was computed for
+        self.slice_keys = Counter() # Geometry keys of the segments summed into self.slice_B_vol
+        self.slice_seg_B = {} # Their fields over the slice
+
+        # Slice fields are computed off the GUI thread; a newer request supersedes older ones
+        self.slice_pool = QThreadPool()
+        self.slice_pool.setMaxThreadCount(1)
+        self.slice_generation = 0
+        self.slice_request = None # (view, keys, segments, known fields) of the latest request
+        self.slice_signals = sliceFieldSignals()
+        self.slice_signals.preview.connect(self.handle_slice_preview_ready)
+        self.slice_signals.ready.connect(self.handle_slice_fields_ready)
+
+        # Speculative computation of neighbouring slices (and the other coils) into self.slice_cache, on a single
+        # thread: more would only contend for the GIL with the GUI thread and the slice actually requested
+        self.prefetch_pool = QThreadPool()
+        self.prefetch_pool.setMaxThreadCount(1)
+        self.prefetch_generation = 0
+
+        # Opt-in: compute the focus coil's whole volume once and serve slices as views of it (see use_volume)
+        self.volume_mode = False
+        self.volume_pool = QThreadPool()
+        self.volume_pool.setMaxThreadCount(1)
+        self.volume_generation = 0
+        self.volume_request = None # (coil, volume key) being computed
+        self.slice_signals.volume.connect(self.handle_coil_volume_ready)
+
+        # The bottom panes update persistent images (see show_slice_images)
+        self.slice_images = None # Artists of the bottom panes; None until (re)built
+        self.slice_images_layout = None # (slice, shape, extent) they were built for
+        self.slice_images_pending = None # Field to show once the bottom panes have an area (see show_slice_images)
+        for widget in (self.view.bl_w, self.view.br_w):
+            widget.canvas.mpl_connect('draw_event', self.handle_bottom_pane_drawn)
+            widget.canvas.mpl_connect('resize_event', self.handle_bottom_pane_resized)
+
+        # Top right pane: the slice plane is moved in place unless the bounding box or coils shown change (see show_scene)
+        self.scene_slice = None
+        self.scene_key = None
 
         self.view.save_clicked.triggered.connect(self.save_menu_clicked)
 
@@ -96,6 +402,7 @@ class Controller:
 
         self.view.tr_w.slice_combo_btn.currentTextChanged.connect(self.slice_button_changed)
         self.view.tr_w.slice_loc_modified_signal.connect(self.handle_slice_loc_changed)
+        self.view.tr_w.slice_mode_btn.currentTextChanged.connect(self.handle_slice_mode_changed)
         self.view.tr_w.export_btn_clicked.connect(self.handle_export_btn_clicked)
         #===================
 
@@ -115,10 +422,7 @@ class Controller:
             self.show_coil_plot()
 
         if len(self.scanner.coils) != 0 and self.coil_focus_index != None:
-            self.update_B_vol_slice()
-
-        if self.coil_focus_index != None and len(self.scanner.get_coils(self.coil_focus_index).segments) != 0:
-            self.show_bottom_plots()
+            self.update_B_vol_slice() # Shows the bottom plots once the slice is computed
 
     def update_num_slices(self):
         '''
@@ -158,48 +462,355 @@ class Controller:
             self.update_selected_slice(self.slice_loc)
             self.view.error_poput('Slice Number Error', 'Invalid slice entered (' + str(slice_req) + '). Enter slice within range listed')
 
-    def update_B_vol_slice(self):
+    def get_slice_volume(self, slice : str, slice_loc : int, scanner : Scanner = None) -> list:
         '''
-        Update self.B_vol_slice to reflect current slice
+        Get the 6-element volume (x-min, x-max, y-min, y-max, z-min, z-max) of a slice
 
-        1. Logic: Matches self.slice to 'x', 'y', or 'z' and creates LV slice_volume according to slice, scanner bounding box,
-        and scanner volume resolution
-        2. Logic: Creates LV B_fields_slice; iteratively calls Segment.calc_seg_B using the defined slice volume and sums all
-        arrays returned during this iterative calling to update self.slice_B_vol to reflect current selection and slice
+        Parameters
+        ----------
+        slice : str
+            Slice axis ('x', 'y', or 'z')
+        slice_loc : int
+            Slice number (starting at 1)
+        scanner : Scanner, optional
+            Scanner whose bounding box and volume resolution to use; defaults to self.scanner
         '''
 
-        match self.slice:
+        scanner = scanner if scanner is not None else self.scanner
+
+        match slice:
                 case 'x':
-                    slice_range = np.arange(self.scanner.get_bbox()[0], self.scanner.get_bbox()[1], self.scanner.get_vol_res()[0])
-                    x = slice_range[self.slice_loc - 1]
-                    y_min = self.scanner.get_bbox()[2]
-                    y_max = self.scanner.get_bbox()[3]
-                    z_min = self.scanner.get_bbox()[4]
-                    z_max = self.scanner.get_bbox()[5]
+                    slice_range = np.arange(scanner.get_bbox()[0], scanner.get_bbox()[1], scanner.get_vol_res()[0])
+                    x = slice_range[slice_loc - 1]
+                    y_min = scanner.get_bbox()[2]
+                    y_max = scanner.get_bbox()[3]
+                    z_min = scanner.get_bbox()[4]
+                    z_max = scanner.get_bbox()[5]
                     slice_volume = [x, x, y_min, y_max, z_min, z_max]
                 case 'y':
-                    slice_range = np.arange(self.scanner.get_bbox()[2], self.scanner.get_bbox()[3], self.scanner.get_vol_res()[1])
-                    y = slice_range[self.slice_loc - 1]
-                    x_min = self.scanner.get_bbox()[0]
-                    x_max = self.scanner.get_bbox()[1]
-                    z_min = self.scanner.get_bbox()[4]
-                    z_max = self.scanner.get_bbox()[5]
+                    slice_range = np.arange(scanner.get_bbox()[2], scanner.get_bbox()[3], scanner.get_vol_res()[1])
+                    y = slice_range[slice_loc - 1]
+                    x_min = scanner.get_bbox()[0]
+                    x_max = scanner.get_bbox()[1]
+                    z_min = scanner.get_bbox()[4]
+                    z_max = scanner.get_bbox()[5]
                     slice_volume = [x_min, x_max, y, y, z_min, z_max]
                 case 'z':
-                    slice_range = np.arange(self.scanner.get_bbox()[4], self.scanner.get_bbox()[5], self.scanner.get_vol_res()[2])
-                    z = slice_range[self.slice_loc - 1]
-                    x_min = self.scanner.get_bbox()[0]
-                    x_max = self.scanner.get_bbox()[1]
-                    y_min = self.scanner.get_bbox()[2]
-                    y_max = self.scanner.get_bbox()[3]
+                    slice_range = np.arange(scanner.get_bbox()[4], scanner.get_bbox()[5], scanner.get_vol_res()[2])
+                    z = slice_range[slice_loc - 1]
+                    x_min = scanner.get_bbox()[0]
+                    x_max = scanner.get_bbox()[1]
+                    y_min = scanner.get_bbox()[2]
+                    y_max = scanner.get_bbox()[3]
                     slice_volume = [x_min, x_max, y_min, y_max, z, z]
 
-        B_fields_slice = []
+        return slice_volume
+
+    def get_seg_B_slice(self, segment : Segment, slice : str, slice_loc : int, scanner : Scanner = None) -> np.ndarray:
+        '''
+        Get the field of a segment over a slice, from self.slice_cache if it was computed before
+
+        Parameters
+        ----------
+        segment : Segment
+            Segment whose field is requested
+        slice : str
+            Slice axis ('x', 'y', or 'z')
+        slice_loc : int
+            Slice number (starting at 1)
+        scanner : Scanner, optional
+            Scanner whose bounding box and volume resolution to use; defaults to self.scanner
+        '''
+
+        scanner = scanner if scanner is not None else self.scanner
+        key = self.slice_cache_key(segment, slice, slice_loc, scanner)
+        seg_B = self.slice_cache.get(key)
+        if seg_B is None:
+            seg_B = self.slice_cache.put(key, segment.calc_seg_B(self.get_slice_volume(slice, slice_loc, scanner)))
+
+        return seg_B
+
+    def slice_cache_key(self, segment : Segment, slice : str, slice_loc : int, scanner : Scanner = None) -> tuple:
+        '''
+        Get the key of a segment's field over a slice in self.slice_cache
+        '''
+
+        scanner = scanner if scanner is not None else self.scanner
+        return (segment.geometry_key(), slice, slice_loc, tuple(scanner.get_bbox()), tuple(scanner.get_vol_res()))
+
+    def get_seg_B_slice_preview(self, segment : Segment, slice : str, slice_loc : int, scanner : Scanner = None,
+                                step : int = 4, n_nodes : int = 8) -> np.ndarray:
+        '''
+        Get a quick, approximate field of a segment over a slice (for a preview while the exact one is computed)
+
+        The segment is only evaluated at every step-th voxel, and the result is linearly interpolated back onto the
+        slice's full grid. Straight and circular segments use their (cheap, exact) closed forms; only true ellipses
+        are integrated with a low-order Gauss-Legendre rule
+
+        Parameters
+        ----------
+        segment : Segment
+            Segment whose field is requested
+        slice : str
+            Slice axis ('x', 'y', or 'z')
+        slice_loc : int
+            Slice number (starting at 1)
+        scanner : Scanner, optional
+            Scanner whose bounding box and volume resolution to use; defaults to self.scanner
+        step : int, optional
+            Spacing (in voxels) of the evaluated voxels
+        n_nodes : int, optional
+            Number of Gauss-Legendre nodes along a true ellipse
+        '''
+
+        scanner = scanner if scanner is not None else self.scanner
+        slice_volume = self.get_slice_volume(slice, slice_loc, scanner)
+        shape = tuple(len(dim) for dim in b_calculation.grid_axes(slice_volume, scanner.get_vol_res()))
+        engine = 'auto' if segment.has_closed_form() else 'gauss'
+        coarse = segment.calc_seg_B(slice_volume, engine=engine, n_nodes=n_nodes, step=step)
+
+        return b_calculation.upsample(coarse, tuple(b_calculation.coarse_index(n, step) for n in shape), shape)
+
+    def update_B_vol_slice(self):
+        '''
+        Request an update of self.B_vol_slice to reflect current slice; the bottom plots are shown once it is ready
+
+        1. Logic: Supersedes any pending request (and the prefetch) so an outdated slice is never shown
+        2. Logic: If the coil, slice, or scanner changed since the last update, every segment's field over the current
+        slice is needed (see get_seg_B_slice; slices visited before come from self.slice_cache); otherwise only the
+        fields of segments that were added or edited since the last update are
+        3. Logic: The needed fields are computed on a worker thread (see sliceFieldTask), which hands them to
+        handle_slice_fields_ready on the GUI thread; if nothing needs computing, that happens immediately
+        4. GUI: While they are computed, a coarse preview of the whole coil is shown (see handle_slice_preview_ready),
+        unless every needed field has a closed form (see Segment.has_closed_form): the exact fields then cost about
+        as much as the preview, which would only add a compute and a redraw
+
+        In volume mode (see use_volume), the slice is instead a view of the focus coil's whole volume once that is
+        computed; until then (e.g., right after an edit), slices are computed as above while the volume is
+        recomputed in the background
+        '''
+
+        self.cancel_B_vol_slice()
+        self.cancel_prefetch()
+
+        coil = self.scanner.get_coils(self.coil_focus_index)
+
+        if self.use_volume():
+            B_slice = coil.get_B_slice(self.slice, self.slice_loc)
+            if B_slice is not None:
+                self.slice_B_vol = B_slice
+                self.slice_view, self.slice_keys, self.slice_seg_B = None, Counter(), {}
+                self.show_bottom_plots()
+                return
+            self.request_coil_volume(coil)
+
+        view = (id(coil), self.slice, self.slice_loc, tuple(self.scanner.get_bbox()), tuple(self.scanner.get_vol_res()))
+        segments = {segment.geometry_key(): segment for segment in coil.segments}
+        keys = Counter(segment.geometry_key() for segment in coil.segments)
+
+        # Exact fields already at hand (from the current view or the cache); the rest are computed
+        known = {}
+        for key, segment in segments.items():
+            seg_B = self.slice_seg_B.get(key) if view == self.slice_view else None
+            seg_B = seg_B if seg_B is not None else self.slice_cache.get(self.slice_cache_key(segment, self.slice, self.slice_loc))
+            if seg_B is not None:
+                known[key] = seg_B
+        needed = {key: segment for key, segment in segments.items() if key not in known}
+        self.slice_request = (view, keys, segments, known)
+
+        if len(needed) == 0:
+            self.handle_slice_fields_ready(self.slice_generation, {})
+        else:
+            preview = None if all(segment.has_closed_form() for segment in needed.values()) else (keys, segments, known)
+            self.slice_pool.start(sliceFieldTask(self, self.slice_generation, self.scanner, needed, self.slice, self.slice_loc,
+                                                 preview=preview))
+
+    def cancel_B_vol_slice(self):
+        '''
+        Supersede the pending slice request: queued work is dropped and a running worker stops after its current
+        segment without reporting back
+        '''
+
+        self.slice_generation += 1
+        self.slice_pool.clear()
+
+    def handle_slice_preview_ready(self, generation : int, B_preview : np.ndarray):
+        '''
+        Handles a coarse preview of the requested slice becoming available (on the GUI thread)
+
+        1. GUI: Shows the preview in the bottom plots unless the request was superseded; self.slice_B_vol is untouched
+        '''
+
+        if generation == self.slice_generation:
+            self.show_bottom_plots(B_preview)
+
+    def handle_slice_fields_ready(self, generation : int, fields : dict):
+        '''
+        Handles the fields of a slice request becoming available (on the GUI thread)
+
+        1. Logic: Ignores results of superseded requests
+        2. Logic: For a new view, sums the fields of all segments into self.slice_B_vol; otherwise subtracts the
+        contribution of every segment no longer in the coil and adds that of every new segment, so editing one
+        segment costs one segment's calculation
+        3. GUI: Shows the bottom plots (or clears them if the coil has no segments) and starts the prefetch
+
+        Parameters
+        ----------
+        generation : int
+            Generation of the request the fields were computed for
+        fields : dict
+            Fields over the slice of the segments that needed computing, keyed by geometry key
+        '''
+
+        if generation != self.slice_generation:
+            return
+
+        view, keys, segments, known = self.slice_request
+        fields = {**known, **fields}
+
+        if view != self.slice_view or not isinstance(self.slice_B_vol, np.ndarray):
+            self.slice_seg_B = dict(fields)
+            self.slice_B_vol = sum(count * self.slice_seg_B[key] for key, count in keys.items())
+        else:
+            for key, count in (self.slice_keys - keys).items(): # Deleted (or edited) segments
+                self.slice_B_vol = self.slice_B_vol - count * self.slice_seg_B[key]
+                if key not in keys:
+                    del self.slice_seg_B[key]
+            for key, count in (keys - self.slice_keys).items(): # New (or edited) segments
+                if key not in self.slice_seg_B:
+                    self.slice_seg_B[key] = fields[key]
+                self.slice_B_vol = self.slice_B_vol + count * self.slice_seg_B[key]
+
+        self.slice_view = view
+        self.slice_keys = keys
+
+        if len(segments) != 0:
+            self.show_bottom_plots()
+        else:
+            self.clear_bottom_plots()
+
+        self.prefetch_slices()
+
+    def prefetch_slices(self, depth : int = 3):
+        '''
+        Speculatively compute slices the user is likely to look at next into self.slice_cache
+
+        1. Logic: Cancels the previous prefetch
+        2. Logic: Queues the focus coil's slices up to depth slices on either side of the current one (nearest
+        first), then the other coils' fields over the current slice, on a low-priority thread pool
+
+        Parameters
+        ----------
+        depth : int, optional
+            Number of slices to prefetch on either side of the current slice
+        '''
+
+        self.cancel_prefetch()
+        if self.scanner is None or self.coil_focus_index is None or self.num_slices is None:
+            return
+
+        coil = self.scanner.get_coils(self.coil_focus_index)
+        for offset in range(1, depth + 1):
+            for slice_loc in (self.slice_loc + offset, self.slice_loc - offset):
+                if 1 <= slice_loc <= self.num_slices:
+                    self.prefetch_pool.start(prefetchSliceTask(self, self.prefetch_generation, self.scanner,
+                                                               list(coil.segments), self.slice, slice_loc))
+        for other in self.scanner.coils:
+            if other is not coil:
+                self.prefetch_pool.start(prefetchSliceTask(self, self.prefetch_generation, self.scanner,
+                                                           list(other.segments), self.slice, self.slice_loc))
+
+    def cancel_prefetch(self):
+        '''
+        Drop queued prefetch tasks and make running ones stop after their current segment
+        '''
+
+        self.prefetch_generation += 1
+        self.prefetch_pool.clear()
+
+    def use_volume(self) -> bool:
+        '''
+        Whether slices are served from the focus coil's whole volume: only in volume mode, and only if the volume
+        fits in VOLUME_MEMORY_FRACTION of the available memory (larger grids fall back to computing each slice)
+        '''
+
+        if not self.volume_mode or self.scanner is None:
+            return False
+
+        n_voxels = np.prod([len(dim) for dim in b_calculation.grid_axes(self.scanner.get_bbox(), self.scanner.get_vol_res())])
+        return 3 * n_voxels * np.dtype(np.float64).itemsize <= self.VOLUME_MEMORY_FRACTION * available_memory()
+
+    def request_coil_volume(self, coil : Coil):
+        '''
+        Compute a coil's whole volume in the background, unless it is already being computed
+
+        Only one coil's volume is kept at a time, so the volumes of the other coils are released
+
+        Parameters
+        ----------
+        coil : Coil
+            Coil whose volume to compute (i.e., the focus coil)
+        '''
+
+        key = coil.volume_key()
+        if len(coil.segments) == 0 or self.volume_request == (coil, key):
+            return
+
+        self.cancel_coil_volume()
+        for other in self.scanner.coils:
+            if other is not coil:
+                other.B_vol, other.B_vol_key = None, None
+        self.volume_request = (coil, key)
+        self.volume_pool.start(coilVolumeTask(self, self.volume_generation, coil, key))
+
+    def cancel_coil_volume(self):
+        '''
+        Supersede the pending coil volume request; a volume being computed is discarded once it is done
+        '''
+
+        self.volume_generation += 1
+        self.volume_pool.clear()
+        self.volume_request = None
 
-        for segment in self.scanner.get_coils(self.coil_focus_index).segments:
-            B_fields_slice.append(segment.calc_seg_B(slice_volume))
+    def handle_coil_volume_ready(self, generation : int, result : tuple):
+        '''
+        Handles a coil volume becoming available (on the GUI thread)
+
+        1. Logic: Stores the volume in the coil (read-only, since slices of it are handed out as views), unless the
+        request was superseded; later slice requests are served from it
 
-        self.slice_B_vol = sum(B_fields_slice)
+        Parameters
+        ----------
+        generation : int
+            Generation of the request the volume was computed for
+        result : tuple
+            (coil, volume key, field over the whole volume)
+        '''
+
+        if generation != self.volume_generation:
+            return
+
+        coil, key, B_vol = result
+        self.volume_request = None
+        B_vol.flags.writeable = False
+        coil.B_vol, coil.B_vol_key = B_vol, key
+
+    def handle_slice_mode_changed(self, mode : str):
+        '''
+        Handles the user switching between computing each slice and serving slices from the whole volume
+
+        1. Logic: Turning volume mode off cancels the volume calculation and releases the coil volumes
+        2. GUI: Updates the bottom plots
+        '''
+
+        self.volume_mode = mode == 'Whole Volume'
+        if not self.volume_mode:
+            self.cancel_coil_volume()
+            for coil in (self.scanner.coils if self.scanner is not None else []):
+                coil.B_vol, coil.B_vol_key = None, None
+
+        if self.scanner is not None and len(self.scanner.coils) != 0 and self.coil_focus_index != None:
+            self.update_B_vol_slice()
 
     def update_selected_slice(self, slice_req):
         '''
@@ -213,10 +824,7 @@ class Controller:
             self.show_coil_plot()
 
         if len(self.scanner.coils) != 0 and self.coil_focus_index != None:
-            self.update_B_vol_slice()
-
-        if self.coil_focus_index != None:
-            self.show_bottom_plots()
+            self.update_B_vol_slice() # Shows the bottom plots once the slice is computed
 
     def done(self):
         """
@@ -234,7 +842,12 @@ class Controller:
         '''
         try:
             export_file = self.view.save_file_dialog()
-            self.view.thread = exportVolThread(export_file, self.scanner, self)
+            maps = self.view.tr_w.export_maps_btn.currentText()
+            self.view.thread = exportVolThread(export_file, self.scanner, self,
+                                               precision=self.view.tr_w.export_precision_btn.currentText(),
+                                               format=self.view.tr_w.export_format_btn.currentText(),
+                                               coil_maps=maps != 'Combined',
+                                               combined=self.EXPORT_COMBINED if maps != 'Per Coil' else ())
             #self.view.connect(self.get_thread.quit, self.done)
             self.view.tr_w.export_btn.setEnabled(False)
             self.view.thread.start()
@@ -306,7 +919,11 @@ class Controller:
         vol_res : list
             The parsed vol_res values from the GUI
         '''
+        self.cancel_B_vol_slice()
+        self.cancel_prefetch()
+        self.cancel_coil_volume()
         self.scanner = Scanner(bbox, vol_res)
+        self.slice_cache.clear()
         self.update_num_slices()
         self.update_coil_control()
         self.show_scanner_plot()
@@ -501,169 +1118,245 @@ class Controller:
 
         self.update_coil_design()
 
-    def show_fields_plot(self):
+    def clear_bottom_plots(self):
         '''
-        Displays the magnetic field plots in the bottom left pane
+        Clears the bottom plots on the GUI
         '''
 
-        
-        # if type(self.scanner.coils[self.coil_focus_index].B_vol_slice) != np.ndarray:
-        #     print('can\'t show field plots; type not array')
-        #     return
-
-        if len(self.view.bl_w.figure.get_axes()) == 4:
-            self.view.bl_w.figure.get_axes()[3].remove()
-
-        # B_field = self.scanner.coils[self.coil_focus_index].B_vol_slice
-        B_field = self.slice_B_vol
-
-
-        Bx = B_field[0, :, :, :]
-        print(Bx.shape)
-
-        By = B_field[1, :, :, :]
-        Bz = B_field[2, :, :, :]
-
-        x_dim = np.arange(self.scanner.bbox[0], self.scanner.bbox[1] + 1e-10, self.scanner.vol_res[0])
-        y_dim = np.arange(self.scanner.bbox[2], self.scanner.bbox[3] + 1e-10, self.scanner.vol_res[1])
-        z_dim = np.arange(self.scanner.bbox[4], self.scanner.bbox[5] + 1e-10, self.scanner.vol_res[2])
-        xv, yv, zv = np.meshgrid(x_dim, y_dim, z_dim, indexing='ij')
-
-        Bx_slice = sim_utils.get_slice(Bx, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        By_slice = sim_utils.get_slice(By, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        Bz_slice = sim_utils.get_slice(Bz, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-
-        if self.slice == 'x':
-            ax1_label, ax2_label = 'y', 'z'
-            ax2 = sim_utils.get_slice(yv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(zv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        elif self.slice == 'y':
-            ax1_label, ax2_label = 'x', 'z'
-            ax2 = sim_utils.get_slice(xv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(zv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        elif self.slice == 'z':
-            ax1_label, ax2_label = 'x', 'y'
-            ax2 = sim_utils.get_slice(xv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(yv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-
-        vmin = min(np.min(Bx_slice), np.min(By_slice), np.min(Bz_slice))
-        vmax = max(np.max(Bx_slice), np.max(By_slice), np.max(Bz_slice))
-        print(vmin)
-        print(vmax)
-        if vmin == 0:
-            norm = mpl.colors.Normalize(vmin = vmin, vmax = vmax)
-        else:
-            norm = mpl.colors.TwoSlopeNorm(vmin=vmin, vcenter=0., vmax=vmax)
-
-
-        self.view.bl_w.axes[0].contourf(ax2, ax1, Bx_slice, levels=20, norm=norm, cmap='RdBu_r')
-        self.view.bl_w.axes[0].set_title(r'$B_x$')
-        self.view.bl_w.axes[0].set_xlabel(ax1_label + " (cm)")
-        self.view.bl_w.axes[0].set_ylabel(ax2_label + " (cm)")
-        self.view.bl_w.axes[0].set_aspect('equal')
-
-        self.view.bl_w.axes[1].contourf(ax2, ax1, By_slice, levels=20, norm=norm, cmap='RdBu_r')
-        self.view.bl_w.axes[1].set_title(r'$B_y$')
-        self.view.bl_w.axes[1].set_xlabel(ax2_label+ " (cm)")
-        self.view.bl_w.axes[1].set_ylabel(ax1_label + " (cm)")
-        self.view.bl_w.axes[1].set_aspect('equal')
-
-        self.view.bl_w.axes[2].contourf(ax2, ax1, Bz_slice, levels=20, norm=norm, cmap='RdBu_r')
-        self.view.bl_w.axes[2].set_title(r'$B_z$')
-        self.view.bl_w.axes[2].set_xlabel(ax1_label + " (cm)")
-        self.view.bl_w.axes[2].set_ylabel(ax2_label + " (cm)")
-        self.view.bl_w.axes[2].set_aspect('equal')
-
-        cax = self.view.bl_w.figure.add_axes([self.view.bl_w.axes[2].get_position().x1 + 0.1, 
-                                              self.view.bl_w.axes[2].get_position().y0, 0.02, 
-                                              self.view.bl_w.axes[2].get_position().y1 - self.view.bl_w.axes[2].get_position().y0])
-        plt.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap='RdBu_r'), cax=cax)
-        
+        self.slice_images = None
+        self.slice_images_pending = None
+        for ax in list(self.view.bl_w.axes) + list(self.view.br_w.axes): # Animated by build_slice_images
+            for spine in ax.spines.values():
+                spine.set_animated(False)
+        for ax in self.view.bl_w.figure.axes:
+            ax.cla()
         self.view.bl_w.canvas.draw()
+        for ax in self.view.br_w.axes:
+            ax.cla()
+        if len(self.view.br_w.figure.get_axes()) > 2:
+            self.view.br_w.figure.get_axes()[2].clear()
+            self.view.br_w.figure.get_axes()[3].clear()
+        self.view.br_w.canvas.draw()
+
+    def show_bottom_plots(self, B_field : np.ndarray = None):
+        self.show_slice_images(B_field)
+
+    def slice_plane(self) -> tuple:
+        '''
+        Get the axes of the current slice
 
-    def show_mag_phase_plot(self):
+        Returns
+        -------
+        tuple
+            (index of the slice axis, horizontal coordinates, vertical coordinates, horizontal label,
+            vertical label) where the coordinates are 1D arrays of the in-plane grid
         '''
-        Shows the magnitude and phase of the sensitivity maps in the bottom right pane
+
+        dims = sim_utils.grid_vectors(self.scanner.get_vol_res(), self.scanner.get_bbox())
+        axis = 'xyz'.index(self.slice)
+        h, v = [i for i in range(3) if i != axis]
+
+        return axis, dims[h], dims[v], 'xyz'[h], 'xyz'[v]
+
+    def show_slice_images(self, B_field : np.ndarray = None):
         '''
+        Displays the field and the sensitivity magnitude and phase of the slice in the bottom panes
 
-        # if type(self.scanner.coils[self.coil_focus_index].B_vol_slice) != np.ndarray:
-        #     print('can\'t show mag phase plots; type not array')
-        #     return
+        1. GUI: Builds the images and colorbars only if the slice axis or grid changed, or the panes were cleared
+        2. GUI: Otherwise, only replaces the data and colour scales of the existing images and redraws just those
+        (and the colorbars whose scale changed) over the cached rest of the panes (see blit_slice_images), so
+        changing slices neither recreates artists nor redraws axes, ticks, and labels. Colour limits are rounded
+        to nice numbers (see sim_utils.nice_limit), so the colour scales of neighbouring slices rarely differ
+        3. GUI: While a pane has no area (e.g., the window is too small to show it), nothing is drawn, since its
+        equal-aspect axes cannot be laid out; the field is shown once the pane is resized (see
+        handle_bottom_pane_resized)
 
-        for axes in self.view.br_w.axes:
-            axes.clear()
+        Parameters
+        ----------
+        B_field : np.ndarray, optional
+            Field over the slice to display (e.g., a preview); defaults to self.slice_B_vol
+        '''
 
-        if len(self.view.br_w.figure.get_axes()) == 4:
-            self.view.br_w.figure.get_axes()[2].remove()
-            self.view.br_w.figure.get_axes()[2].remove()
+        B_field = B_field if B_field is not None else self.slice_B_vol
+        if any(widget.figure.bbox.width <= 0 or widget.figure.bbox.height <= 0 for widget in (self.view.bl_w, self.view.br_w)):
+            self.slice_images_pending = B_field
+            return
+        self.slice_images_pending = None
+
+        axis, h_dim, v_dim, h_label, v_label = self.slice_plane()
+        B_plane = np.take(B_field, 0, axis=axis + 1).transpose(0, 2, 1) # (3, Nv, Nh): imshow takes rows along v
+
+        # Pixels are centred on the voxels
+        h_half = (h_dim[1] - h_dim[0]) / 2 if len(h_dim) > 1 else 0.5
+        v_half = (v_dim[1] - v_dim[0]) / 2 if len(v_dim) > 1 else 0.5
+        extent = (h_dim[0] - h_half, h_dim[-1] + h_half, v_dim[0] - v_half, v_dim[-1] + v_half)
+
+        layout = (self.slice, B_plane.shape, extent)
+        if self.slice_images is None or layout != self.slice_images_layout:
+            self.build_slice_images(B_plane.shape[1:], extent, h_label, v_label)
+            self.slice_images_layout = layout
+
+        changed = [False, False] # Whether the colour scale of each pane changed
+        vmin, vmax = float(B_plane.min()), float(B_plane.max())
+        limits = (-sim_utils.nice_limit(-vmin), sim_utils.nice_limit(vmax))
+        if limits != self.slice_images['limits'][0]:
+            if limits[0] < 0 < limits[1]:
+                norm = mpl.colors.TwoSlopeNorm(vmin=limits[0], vcenter=0., vmax=limits[1])
+            else:
+                norm = mpl.colors.Normalize(vmin=limits[0], vmax=limits[1])
+            for image in self.slice_images['fields']:
+                image.set_norm(norm)
+            self.slice_images['limits'][0] = limits
+            changed[0] = True
+        for image, component in zip(self.slice_images['fields'], B_plane):
+            image.set_data(component)
+
+        B_complex = B_plane[0] - 1j * B_plane[1]
+        B_mag = np.abs(B_complex)
+        limits = (0., sim_utils.nice_limit(float(B_mag.max())))
+        if limits != self.slice_images['limits'][1]:
+            self.slice_images['mag'].set_clim(*limits)
+            self.slice_images['limits'][1] = limits
+            changed[1] = True
+        self.slice_images['mag'].set_data(B_mag)
+        self.slice_images['phase'].set_data(np.angle(B_complex))
+
+        self.blit_slice_images(changed)
+
+    def blit_slice_images(self, changed : list):
+        '''
+        Redraw the images (and the colorbars whose scale changed) of the bottom panes over their cached backgrounds
 
-        # B_field = self.scanner.coils[self.coil_focus_index].B_vol_slice
-        B_field = self.slice_B_vol
-        B_complex = B_field[0, :, :, :] - 1j * B_field[1, :, :, :]    
+        A pane without a cached background (i.e., not drawn in full since its images were built) is drawn in full
+        instead, which caches it (see handle_bottom_pane_drawn)
 
-        x_dim = np.arange(self.scanner.bbox[0], self.scanner.bbox[1] + 1e-10, self.scanner.vol_res[0])
-        y_dim = np.arange(self.scanner.bbox[2], self.scanner.bbox[3] + 1e-10, self.scanner.vol_res[1])
-        z_dim = np.arange(self.scanner.bbox[4], self.scanner.bbox[5] + 1e-10, self.scanner.vol_res[2])
-        xv, yv, zv = np.meshgrid(x_dim, y_dim, z_dim, indexing='ij')
+        Parameters
+        ----------
+        changed : list
+            Whether the colour scale of each pane changed
+        '''
 
-        B_slice = sim_utils.get_slice(B_complex, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        B_mag = np.abs(B_slice)
-        B_phase = np.angle(B_slice)
+        for pane, (widget, images, colorbars) in enumerate(self.slice_images['panes']):
+            if self.slice_images['backgrounds'][pane] is None:
+                widget.canvas.draw_idle()
+                continue
 
-        if self.slice == 'x':
-            ax1_label, ax2_label = 'y', 'z'
-            ax2 = sim_utils.get_slice(yv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(zv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        elif self.slice == 'y':
-            ax1_label, ax2_label = 'x', 'z'
-            ax2 = sim_utils.get_slice(xv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(zv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-        elif self.slice == 'z':
-            ax1_label, ax2_label = 'x', 'y'
-            ax2 = sim_utils.get_slice(xv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
-            ax1 = sim_utils.get_slice(yv, self.slice, self.slice_loc, self.scanner.vol_res, self.scanner.bbox)
+            # The background lacks the changing colorbars; unless their scale changed, they are restored as drawn last
+            widget.canvas.restore_region(self.slice_images['backgrounds'][pane])
+            if not changed[pane]:
+                for region in self.slice_images['colorbars'][pane]:
+                    widget.canvas.restore_region(region)
+            self.draw_slice_images(pane, colorbars=changed[pane])
+            widget.canvas.blit(widget.figure.bbox)
 
-        divider1 = make_axes_locatable(self.view.br_w.figure.axes[0])
-        cax1 = divider1.append_axes('right', size='5%', pad=0.05)
-        divider2 = make_axes_locatable(self.view.br_w.figure.axes[1])
-        cax2 = divider2.append_axes('right', size='5%', pad=0.05)
+    def draw_slice_images(self, pane : int, colorbars : bool = True):
+        '''
+        Draw the animated artists of a bottom pane (see build_slice_images) over what it currently shows
 
-        im1 = self.view.br_w.figure.axes[0].contourf(ax2, ax1, B_mag, levels=20)
-        self.view.br_w.figure.axes[0].set_title('Magnitude')
-        self.view.br_w.figure.axes[0].set_xlabel(ax1_label + " (cm)")
-        self.view.br_w.figure.axes[0].set_ylabel(ax2_label + " (cm)")
-        self.view.br_w.figure.axes[0].set_aspect('equal')
+        Parameters
+        ----------
+        pane : int
+            0 for the fields pane, 1 for the magnitude and phase pane
+        colorbars : bool, optional
+            Whether to draw the changing colorbars too (and cache them as drawn)
+        '''
 
-        im2 = self.view.br_w.figure.axes[1].contourf(ax2, ax1, B_phase, levels=20)
-        self.view.br_w.figure.axes[1].set_title('Phase')
-        self.view.br_w.figure.axes[1].set_xlabel(ax1_label  + " (cm)")
-        self.view.br_w.figure.axes[1].set_ylabel(ax2_label + " (cm)")
-        self.view.br_w.figure.axes[1].set_aspect('equal')
+        widget, images, caxes = self.slice_images['panes'][pane]
+        for image in images:
+            widget.figure.draw_artist(image)
+            for spine in image.axes.spines.values():
+                widget.figure.draw_artist(spine)
+        if colorbars:
+            renderer = widget.canvas.get_renderer()
+            for cax in caxes:
+                widget.figure.draw_artist(cax)
+            self.slice_images['colorbars'][pane] = [widget.canvas.copy_from_bbox(cax.get_tightbbox(renderer).padded(2))
+                                                    for cax in caxes]
+
+    def handle_bottom_pane_drawn(self, event):
+        '''
+        Handles a bottom pane being drawn in full (e.g., after it was built or resized)
 
-        self.view.br_w.figure.colorbar(im1, cax=cax1, orientation='vertical')
-        self.view.br_w.figure.colorbar(im2, cax=cax2, orientation='vertical') 
+        1. GUI: Caches the pane (without the animated artists) for blit_slice_images
+        2. GUI: Draws the animated artists on top
+        '''
 
-        self.view.br_w.canvas.draw()  
+        if self.slice_images is None:
+            return
 
-    def clear_bottom_plots(self):
+        for pane, (widget, images, colorbars) in enumerate(self.slice_images['panes']):
+            if event.canvas is widget.canvas:
+                self.slice_images['backgrounds'][pane] = widget.canvas.copy_from_bbox(widget.figure.bbox)
+                self.draw_slice_images(pane)
+
+    def handle_bottom_pane_resized(self, event):
         '''
-        Clears the bottom plots on the GUI
+        Handles a bottom pane being resized: shows the field that could not be shown while the panes had no area
         '''
 
-        for ax in self.view.bl_w.figure.axes:
-            ax.cla()
-        self.view.bl_w.canvas.draw()
-        for ax in self.view.br_w.axes:
+        if self.slice_images_pending is not None:
+            self.show_slice_images(self.slice_images_pending)
+
+    def build_slice_images(self, shape : tuple, extent : tuple, h_label : str, v_label : str):
+        '''
+        Create the images and colorbars of the bottom panes (see show_slice_images), replacing whatever they show
+
+        Parameters
+        ----------
+        shape : tuple
+            (rows, columns) of the images
+        extent : tuple
+            (left, right, bottom, top) of the images
+        h_label : str
+            Horizontal axis
+        v_label : str
+            Vertical axis
+        '''
+
+        fields_w, mag_phase_w = self.view.bl_w, self.view.br_w
+        for ax in fields_w.figure.axes[3:] + mag_phase_w.figure.axes[2:]: # Colorbars
+            ax.remove()
+        for ax in list(fields_w.axes) + list(mag_phase_w.axes):
             ax.cla()
-        if len(self.view.br_w.figure.get_axes()) > 2:
-            self.view.br_w.figure.get_axes()[2].clear()
-            self.view.br_w.figure.get_axes()[3].clear()
-        self.view.br_w.canvas.draw()
 
-    def show_bottom_plots(self):
-        self.clear_bottom_plots()
-        self.show_fields_plot()
-        self.show_mag_phase_plot()
+        blank = np.zeros(shape)
+        options = dict(origin='lower', extent=extent, interpolation='nearest')
+
+        fields = []
+        for ax, title in zip(fields_w.axes, (r'$B_x$', r'$B_y$', r'$B_z$')):
+            fields.append(ax.imshow(blank, cmap='RdBu_r', **options))
+            ax.set_title(title)
+            ax.set_xlabel(h_label + " (cm)")
+            ax.set_ylabel(v_label + " (cm)")
+        cax = fields_w.figure.add_axes([fields_w.axes[2].get_position().x1 + 0.1,
+                                        fields_w.axes[2].get_position().y0, 0.02,
+                                        fields_w.axes[2].get_position().y1 - fields_w.axes[2].get_position().y0])
+        fields_w.figure.colorbar(fields[0], cax=cax)
+        fields_cax = cax
+
+        mag = mag_phase_w.axes[0].imshow(blank, **options)
+        phase = mag_phase_w.axes[1].imshow(blank, vmin=-np.pi, vmax=np.pi, **options)
+        for ax, image, title in ((mag_phase_w.axes[0], mag, 'Magnitude'), (mag_phase_w.axes[1], phase, 'Phase')):
+            ax.set_title(title)
+            ax.set_xlabel(h_label + " (cm)")
+            ax.set_ylabel(v_label + " (cm)")
+            cax = make_axes_locatable(ax).append_axes('right', size='5%', pad=0.05)
+            mag_phase_w.figure.colorbar(image, cax=cax, orientation='vertical')
+            if image is mag:
+                mag_cax = cax
+
+        # The colorbars whose scale follows the data, and the edges of the images' axes (which the images would
+        # cover), are animated: left out of full draws (and so of the cached backgrounds) and drawn over them
+        # instead; the phase colorbar is fixed. (Images are always drawn, and are simply drawn over)
+        fields_cax.set_animated(True)
+        mag_cax.set_animated(True)
+        for ax in list(fields_w.axes) + list(mag_phase_w.axes):
+            for spine in ax.spines.values():
+                spine.set_animated(True)
+
+        self.slice_images = {'fields': fields, 'mag': mag, 'phase': phase,
+                             'panes': [(fields_w, fields, [fields_cax]), (mag_phase_w, [mag, phase], [mag_cax])],
+                             'limits': [None, None], 'backgrounds': [None, None], 'colorbars': [[], []]}
 
     def update_coil_control(self):
         '''
@@ -696,85 +1389,11 @@ class Controller:
         '''
         Displays (i.e., plots) the current 'Scanner' with all coils in the coil control pane of the GUI
 
-        1. Clears the previously displayed plot (to prevent ghosting residue)
-        2. Sets labels and view, and plots the bounding box within the frmae
-        3. Plots the currently 'in-focus' slice within the bounding box plot
-        4. Iteratively plots every coil within the scanner frame
+        1. Plots the bounding box, the currently 'in-focus' slice within it, and every coil within the scanner frame
+        2. If only the slice changed since the last plot, just moves it (see show_scene)
         '''
 
-        self.view.tr_w.ax.cla()
-        self.view.tr_w.ax.set_xlabel("$x$")
-        self.view.tr_w.ax.set_ylabel("$y$")
-        self.view.tr_w.ax.set_zlabel("$z$")
-        x_dif = self.scanner.get_bbox()[1] - self.scanner.get_bbox()[0]
-        y_dif = self.scanner.get_bbox()[3] - self.scanner.get_bbox()[2]
-        z_dif = self.scanner.get_bbox()[5] - self.scanner.get_bbox()[4]
-        self.view.tr_w.ax.set_xlim(self.scanner.get_bbox()[0] - 0.25 * x_dif, self.scanner.get_bbox()[1] + 0.25 * x_dif)
-        self.view.tr_w.ax.set_ylim(self.scanner.get_bbox()[2] - 0.25 * y_dif, self.scanner.get_bbox()[3] + 0.25 * y_dif)
-        self.view.tr_w.ax.set_zlim(self.scanner.get_bbox()[4] - 0.25 * z_dif, self.scanner.get_bbox()[5] + 0.25 * z_dif)
-        self.view.tr_w.ax.set_aspect('equal')
-
-        bbox_vertices = [
-            (self.scanner.get_bbox()[0], self.scanner.get_bbox()[2], self.scanner.get_bbox()[4]),
-            (self.scanner.get_bbox()[1], self.scanner.get_bbox()[2], self.scanner.get_bbox()[4]),
-            (self.scanner.get_bbox()[0], self.scanner.get_bbox()[3], self.scanner.get_bbox()[4]),
-            (self.scanner.get_bbox()[1], self.scanner.get_bbox()[3], self.scanner.get_bbox()[4]),
-            (self.scanner.get_bbox()[0], self.scanner.get_bbox()[2], self.scanner.get_bbox()[5]),
-            (self.scanner.get_bbox()[1], self.scanner.get_bbox()[2], self.scanner.get_bbox()[5]),
-            (self.scanner.get_bbox()[0], self.scanner.get_bbox()[3], self.scanner.get_bbox()[5]),
-            (self.scanner.get_bbox()[1], self.scanner.get_bbox()[3], self.scanner.get_bbox()[5])
-        ]
-
-        bbox_faces = [
-            (bbox_vertices[0], bbox_vertices[1], bbox_vertices[3], bbox_vertices[2]),
-            (bbox_vertices[4], bbox_vertices[5], bbox_vertices[7], bbox_vertices[6]),
-            (bbox_vertices[1], bbox_vertices[3], bbox_vertices[7], bbox_vertices[5]),
-            (bbox_vertices[0], bbox_vertices[2], bbox_vertices[6], bbox_vertices[4]),
-            (bbox_vertices[2], bbox_vertices[3], bbox_vertices[7], bbox_vertices[6]),
-            (bbox_vertices[0], bbox_vertices[1], bbox_vertices[5], bbox_vertices[4]),
-        ]
-
-        bbox_prism = Poly3DCollection(bbox_faces, linewidths=1, edgecolors='b', alpha=0.2)
-        self.view.tr_w.ax.add_collection3d(bbox_prism)
-
-        match self.slice:
-            case 'x':
-                slice_range = np.arange(self.scanner.get_bbox()[0], self.scanner.get_bbox()[1], self.scanner.get_vol_res()[0])
-                x = slice_range[self.slice_loc - 1]
-                y_min = self.scanner.get_bbox()[2]
-                y_max = self.scanner.get_bbox()[3]
-                z_min = self.scanner.get_bbox()[4]
-                z_max = self.scanner.get_bbox()[5]
-                slice = Poly3DCollection([[(x, y_min, z_min), (x, y_max, z_min), (x, y_max, z_max), (x, y_min, z_max)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-            case 'y':
-                slice_range = np.arange(self.scanner.get_bbox()[2], self.scanner.get_bbox()[3], self.scanner.get_vol_res()[1])
-                y = slice_range[self.slice_loc - 1]
-                x_min = self.scanner.get_bbox()[0]
-                x_max = self.scanner.get_bbox()[1]
-                z_min = self.scanner.get_bbox()[4]
-                z_max = self.scanner.get_bbox()[5]
-                slice = Poly3DCollection([[(x_min, y, z_min), (x_max, y, z_min), (x_max, y, z_max), (x_min, y, z_max)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-            case 'z':
-                slice_range = np.arange(self.scanner.get_bbox()[4], self.scanner.get_bbox()[5], self.scanner.get_vol_res()[2])
-                z = slice_range[self.slice_loc - 1]
-                x_min = self.scanner.get_bbox()[0]
-                x_max = self.scanner.get_bbox()[1]
-                y_min = self.scanner.get_bbox()[2]
-                y_max = self.scanner.get_bbox()[3]
-                slice = Poly3DCollection([[(x_min, y_min, z), (x_max, y_min, z), (x_max, y_max, z), (x_min, y_max, z)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-        for coil in self.scanner.coils:
-            if (self.coil_focus_index != None) and (self.scanner.coils[self.coil_focus_index] == coil):
-                coil.plot_coil(self.view.tr_w.ax, True, self.segment_focus_index)
-            else:
-                coil.plot_coil(self.view.tr_w.ax, False, self.segment_focus_index)
-        
-        self.view.tr_w.canvas.draw()
+        self.show_scene(self.scanner.coils, equal_aspect = True)
         # self.view.tr_w.figure.savefig('test_figure.png', bbox_inches='tight', dpi=600)
 
     def update_segment_scroll(self):
@@ -803,22 +1422,50 @@ class Controller:
         '''
         Displays the coil plot
 
-        1. Clears the previous plot to prevent labeling and defines the frame
-        2. Plots bounding box with current slice
-        3. Plots in-focus coil
+        1. Plots bounding box with current slice
+        2. Plots in-focus coil
+        3. If only the slice changed since the last plot, just moves it (see show_scene)
+        '''
+
+        self.show_scene([self.scanner.coils[self.coil_focus_index]])
+
+    def show_scene(self, coils : list, equal_aspect : bool = False):
         '''
+        Displays the bounding box, the current slice, and coils in the top right pane
+
+        1. GUI: If the bounding box or the coils shown changed since the last call, clears the plot and builds the
+        scene: the bounding box prism, the slice plane, every segment of every coil as a single Line3DCollection, and
+        their direction arrows as a single quiver (the segments' points are cached, see Segment.get_polyline)
+        2. GUI: Otherwise, only moves the slice plane
+        3. GUI: Schedules a redraw
+
+        Parameters
+        ----------
+        coils : list
+            Coils to plot
+        equal_aspect : bool, optional
+            Whether to give the axes equal aspect ratios
+        '''
+
+        key = (tuple(self.scanner.get_bbox()), equal_aspect,
+               tuple(tuple(segment.geometry_key() for segment in coil.segments) for coil in coils))
+        if self.scene_slice is not None and key == self.scene_key:
+            self.scene_slice.set_verts([self.get_slice_polygon()])
+            self.view.tr_w.canvas.draw_idle()
+            return
 
         self.view.tr_w.ax.cla()
         self.view.tr_w.ax.set_xlabel("$x$")
         self.view.tr_w.ax.set_ylabel("$y$")
         self.view.tr_w.ax.set_zlabel("$z$")
-
         x_dif = self.scanner.get_bbox()[1] - self.scanner.get_bbox()[0]
         y_dif = self.scanner.get_bbox()[3] - self.scanner.get_bbox()[2]
         z_dif = self.scanner.get_bbox()[5] - self.scanner.get_bbox()[4]
         self.view.tr_w.ax.set_xlim(self.scanner.get_bbox()[0] - 0.25 * x_dif, self.scanner.get_bbox()[1] + 0.25 * x_dif)
         self.view.tr_w.ax.set_ylim(self.scanner.get_bbox()[2] - 0.25 * y_dif, self.scanner.get_bbox()[3] + 0.25 * y_dif)
         self.view.tr_w.ax.set_zlim(self.scanner.get_bbox()[4] - 0.25 * z_dif, self.scanner.get_bbox()[5] + 0.25 * z_dif)
+        if equal_aspect:
+            self.view.tr_w.ax.set_aspect('equal')
 
         bbox_vertices = [
             (self.scanner.get_bbox()[0], self.scanner.get_bbox()[2], self.scanner.get_bbox()[4]),
@@ -843,40 +1490,41 @@ class Controller:
         bbox_prism = Poly3DCollection(bbox_faces, linewidths=1, edgecolors='b', alpha=0.2)
         self.view.tr_w.ax.add_collection3d(bbox_prism)
 
-        match self.slice:
-            case 'x':
-                slice_range = np.arange(self.scanner.get_bbox()[0], self.scanner.get_bbox()[1], self.scanner.get_vol_res()[0])
-                x = slice_range[self.slice_loc - 1]
-                y_min = self.scanner.get_bbox()[2]
-                y_max = self.scanner.get_bbox()[3]
-                z_min = self.scanner.get_bbox()[4]
-                z_max = self.scanner.get_bbox()[5]
-                slice = Poly3DCollection([[(x, y_min, z_min), (x, y_max, z_min), (x, y_max, z_max), (x, y_min, z_max)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-            case 'y':
-                slice_range = np.arange(self.scanner.get_bbox()[2], self.scanner.get_bbox()[3], self.scanner.get_vol_res()[1])
-                y = slice_range[self.slice_loc - 1]
-                x_min = self.scanner.get_bbox()[0]
-                x_max = self.scanner.get_bbox()[1]
-                z_min = self.scanner.get_bbox()[4]
-                z_max = self.scanner.get_bbox()[5]
-                slice = Poly3DCollection([[(x_min, y, z_min), (x_max, y, z_min), (x_max, y, z_max), (x_min, y, z_max)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-            case 'z':
-                slice_range = np.arange(self.scanner.get_bbox()[4], self.scanner.get_bbox()[5], self.scanner.get_vol_res()[2])
-                z = slice_range[self.slice_loc - 1]
-                x_min = self.scanner.get_bbox()[0]
-                x_max = self.scanner.get_bbox()[1]
-                y_min = self.scanner.get_bbox()[2]
-                y_max = self.scanner.get_bbox()[3]
-                slice = Poly3DCollection([[(x_min, y_min, z), (x_max, y_min, z), (x_max, y_max, z), (x_min, y_max, z)]],
-                                          linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
-                self.view.tr_w.ax.add_collection3d(slice)
-        
-        self.scanner.coils[self.coil_focus_index].plot_coil(self.view.tr_w.ax, False, self.coil_focus_index)
-        self.view.tr_w.canvas.draw()  
+        self.scene_slice = Poly3DCollection([self.get_slice_polygon()], linewidths = 1, edgecolors = 'r', facecolors = 'r', alpha = 0.2)
+        self.view.tr_w.ax.add_collection3d(self.scene_slice)
+
+        polylines = [polyline for coil in coils for polyline in coil.get_polylines()]
+        if len(polylines) != 0:
+            self.view.tr_w.ax.add_collection3d(Line3DCollection(polylines, colors = 'black', linewidths = 2))
+            arrows = np.concatenate([coil.get_arrows() for coil in coils])
+            self.view.tr_w.ax.quiver(*arrows.T, color = 'black', pivot = 'middle', length = 5)
+
+        self.scene_key = key
+        self.view.tr_w.canvas.draw_idle()
+
+    def get_slice_polygon(self) -> list:
+        '''
+        Get the corners of the current slice (for plotting)
+
+        Returns
+        -------
+        list
+            Four (x, y, z) corners of the slice, going around it
+        '''
+
+        slice_volume = self.get_slice_volume(self.slice, self.slice_loc)
+        axis = 'xyz'.index(self.slice)
+        h, v = [i for i in range(3) if i != axis]
+
+        polygon = []
+        for h_bound, v_bound in ((0, 0), (1, 0), (1, 1), (0, 1)):
+            corner = [0., 0., 0.]
+            corner[axis] = slice_volume[2 * axis]
+            corner[h] = slice_volume[2 * h + h_bound]
+            corner[v] = slice_volume[2 * v + v_bound]
+            polygon.append(tuple(corner))
+
+        return polygon
 
     def update_coil_design(self):
         '''
@@ -890,23 +1538,13 @@ class Controller:
         and segment focus otherwise.
         '''
 
-        self.update_B_vol_slice()
+        self.update_B_vol_slice() # Shows (or clears) the bottom plots once the slice is computed
 
         self.update_segment_scroll()
         self.show_coil_plot()
 
         if not self.view.tl_w.coil_design.add_seg_btn.isChecked():
             self.view.tl_w.coil_design.clear_all_text() 
-        
-        if len(self.scanner.coils) >= 1 and len(self.scanner.coils[-1].segments) >= 1:
-            self.show_bottom_plots()
-        else:
-            # if len(self.scanner.coils) == 0:
-            #     self.update_coil_focus(None)
-            #     self.update_segment_focus(None)
-            # elif len(self.scanner.coils[-1].segments) == 0:
-            #     self.update_segment_focus(None)
-            self.clear_bottom_plots()      
 
     def update_coil_focus(self, index : int | None):
         '''
@@ -927,6 +1565,8 @@ class Controller:
 
         self.view.tl_w.coil_control.remove_highlight(self.coil_focus_index)
 
+        self.cancel_B_vol_slice()
+        self.cancel_prefetch()
         self.coil_focus_index = index
         self.update_num_slices()
 
@@ -934,11 +1574,9 @@ class Controller:
             self.disable_coil_ed()
             self.clear_bottom_plots()
         else:
-            self.update_B_vol_slice()
+            self.update_B_vol_slice() # Shows the bottom plots once the slice is computed
             self.enable_coil_ed()
             self.view.tl_w.coil_control.highlight_selected(self.coil_focus_index)
-            if len(self.scanner.coils[self.coil_focus_index].segments) >= 1:
-                self.show_bottom_plots()
 
     def enable_coil_ed(self):
         '''
@@ -997,13 +1635,19 @@ class Controller:
     def save_workspace(self):
         '''
         Saves the current workspace
+
+        The computed fields (whole coil volumes and cached slices) are saved next to it in a binary sidecar (see
+        encoder.save_fields), so they need not be recomputed when the workspace is loaded again. The sidecar is
+        written first, so the workspace only ever refers to a complete one
         '''
         try:
             if self.file is None:
                 self.file = self.view.save_file_dialog()
 
+            self.fields_file = encoder.save_fields(self.file, self.scanner, self.slice_cache)
             with open(self.file, "w") as json_file:
                 json.dump(self, json_file, cls = CustomEncoder, indent=4)
+            encoder.remove_old_fields(self.file, self.fields_file)
         except Exception as e:
             print('Error saving workspace')
             print(e)
@@ -1013,9 +1657,15 @@ class Controller:
         '''
         Loads a stored workspace, throwing an error if it is not completed
         Uses the stored user values 
+
+        If the workspace's field sidecar still matches its geometry, the saved fields are memory-mapped back (see
+        encoder.load_fields)
         '''
         try:
             self.file = self.view.open_file_dialog()    
+            self.cancel_B_vol_slice()
+            self.cancel_prefetch()
+            self.cancel_coil_volume()
 
             with open(self.file, "r") as json_file:
                 data = json.load(json_file)
@@ -1057,6 +1707,10 @@ class Controller:
                     self.scanner.add_coils(coil_to_add)
 
                 self.user_inputs = data['user_inputs']
+            self.slice_cache.clear()
+            self.fields_file = data.get('fields_file')
+            if self.fields_file is not None:
+                encoder.load_fields(encoder.fields_path(self.file, self.fields_file), self.scanner, self.slice_cache)
             self.update_num_slices()
             return True
         
@@ -1,4 +1,9 @@
+import hashlib
 import json
+import os
+import tempfile
+import zipfile
+import numpy as np
 
 class CustomEncoder(json.JSONEncoder):
 
@@ -10,6 +15,7 @@ class CustomEncoder(json.JSONEncoder):
                 'user_inputs': obj.user_inputs,
                 'scanner_bbox': obj.scanner.bbox,
                 'scanner_vol_res': obj.scanner.vol_res,
+                'fields_file': obj.fields_file, # Binary sidecar of the computed fields (see save_fields)
                 # 'coils': self.encode_coils(obj)
             }
             return obj_dict
@@ -24,3 +30,165 @@ class CustomEncoder(json.JSONEncoder):
                 to_append.append(seg.seg_B.tolist())
             to_return.append(to_append)
         return to_return
+
+
+def fields_path(workspace_file : str, fields_file : str) -> str:
+    '''
+    Get the path of the binary sidecar holding the computed fields of a workspace file, from the
+    sidecar's file name recorded in the workspace (sidecars are kept next to their workspace file)
+    '''
+    return os.path.join(os.path.dirname(workspace_file), os.path.basename(fields_file))
+
+
+def workspace_hash(scanner) -> str:
+    '''
+    Hash everything the fields of a workspace depend on: the geometry of every segment of every
+    coil, the bounding box, and the volume resolution
+    '''
+    description = [[list(segment.geometry_key()) for segment in coil.segments] for coil in scanner.coils]
+    description += [list(scanner.get_bbox()), list(scanner.get_vol_res())]
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+
+def save_fields(workspace_file : str, scanner, slice_cache) -> str:
+    '''
+    Write the computed fields of a workspace to a new (uncompressed, so memory-mappable) .npz sidecar
+    next to the workspace file
+
+    The sidecar holds every coil's whole volume that is up to date (Coil.B_vol) and the cached
+    per-segment slice fields of the current segments, bounding box, and volume resolution, tagged
+    with workspace_hash. Every save writes a sidecar under a new name (e.g., design.fields.k2x8_q1.npz
+    for design.json) instead of overwriting the previous one: the fields loaded from that one may
+    still be memory-mapped, and a mapped file can be neither replaced nor deleted on Windows. The
+    workspace then records the new name, and the previous sidecars are removed with
+    remove_old_fields.
+
+    Parameters
+    ----------
+    workspace_file : str
+        Path of the workspace file
+    scanner : Scanner
+        Scanner of the workspace
+    slice_cache : FieldCache
+        Cache of per-segment slice fields (see Controller.slice_cache)
+
+    Returns
+    -------
+    str
+        File name of the sidecar written, or None if there were no fields to save
+    '''
+    arrays = {}
+    for i, coil in enumerate(scanner.coils):
+        if coil.B_vol is not None and coil.B_vol_key == coil.volume_key():
+            arrays['coil_' + str(i)] = coil.B_vol
+
+    geometry = {segment.geometry_key() for coil in scanner.coils for segment in coil.segments}
+    grid = (tuple(scanner.get_bbox()), tuple(scanner.get_vol_res()))
+    slice_keys = []
+    for key, seg_B in slice_cache.items():
+        if key[0] in geometry and key[3:] == grid:
+            arrays['slice_' + str(len(slice_keys))] = seg_B
+            slice_keys.append(key)
+
+    if len(arrays) == 0:
+        return None
+
+    stem = os.path.splitext(os.path.basename(workspace_file))[0]
+    descriptor, path = tempfile.mkstemp(prefix=stem + '.fields.', suffix='.npz',
+                                        dir=os.path.dirname(workspace_file) or None)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            np.savez(file, hash=np.array(workspace_hash(scanner)), slice_keys=np.array(json.dumps(slice_keys)), **arrays)
+    except BaseException:
+        os.remove(path)
+        raise
+    return os.path.basename(path)
+
+
+def remove_old_fields(workspace_file : str, fields_file : str = None):
+    '''
+    Delete the sidecars of a workspace file other than fields_file (the one the workspace records)
+
+    Sidecars that are still memory-mapped cannot be deleted on Windows; they are left behind and
+    removed by a later save
+    '''
+    directory = os.path.dirname(workspace_file) or '.'
+    prefix = os.path.splitext(os.path.basename(workspace_file))[0] + '.fields.'
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.npz') and name != fields_file:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def load_fields(path : str, scanner, slice_cache) -> bool:
+    '''
+    Memory-map the fields of a sidecar written by save_fields back into a workspace, if the sidecar
+    still matches it (i.e., has the same workspace_hash)
+
+    Coil volumes are restored into Coil.B_vol and slice fields into slice_cache; nothing is read
+    until it is used
+
+    Parameters
+    ----------
+    path : str
+        Path of the sidecar (see fields_path)
+    scanner : Scanner
+        Scanner of the loaded workspace
+    slice_cache : FieldCache
+        Cache of per-segment slice fields to fill
+
+    Returns
+    -------
+    bool
+        True if the sidecar exists and matches the workspace
+    '''
+    if not os.path.exists(path):
+        return False
+
+    arrays = _memmap_npz(path)
+    if 'hash' not in arrays or str(arrays['hash'][()]) != workspace_hash(scanner):
+        return False
+
+    for i, coil in enumerate(scanner.coils):
+        if 'coil_' + str(i) in arrays:
+            coil.B_vol, coil.B_vol_key = arrays['coil_' + str(i)], coil.volume_key()
+
+    for i, key in enumerate(json.loads(str(arrays['slice_keys'][()]))):
+        slice_cache.put(_as_tuple(key), arrays['slice_' + str(i)])
+
+    return True
+
+
+def _memmap_npz(path : str) -> dict:
+    # np.load does not memory-map the members of an .npz; since np.savez stores them uncompressed,
+    # each member's .npy data can be mapped directly at its offset within the archive
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                continue
+            file.seek(info.header_offset)
+            header = file.read(30) # Local file header; its name and extra field lengths are at bytes 26-29
+            file.seek(info.header_offset + 30 + int.from_bytes(header[26:28], 'little') + int.from_bytes(header[28:30], 'little'))
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+            name = info.filename[:-len('.npy')]
+            if dtype.hasobject:
+                continue
+            elif shape == () or 0 in shape: # (np.memmap cannot map empty arrays)
+                arrays[name] = np.lib.format.read_array(archive.open(info))
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def _as_tuple(value):
+    # JSON turns the tuples of a key into lists
+    return tuple(_as_tuple(item) for item in value) if isinstance(value, list) else value
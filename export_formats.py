@@ -0,0 +1,175 @@
+'''
+Chunked, compressed export of coil sensitivities to HDF5 or Zarr
+
+Each coil is written to its own dataset (coil_000, coil_001, ...) of shape (Nx, Ny, Nz), and each
+combined map (rss, roemer, max_coil; see b_calculation.combined_maps) to one of the same shape,
+chunked so that a chunk never straddles two of the export's z-slabs and compressed chunk by chunk
+as the slabs are computed. The voxel coordinates are stored alongside (x, y, and z datasets), and the
+scanner's bounding box, volume resolution, and coil geometry as attributes, so a single coil or
+slice can be read without loading the rest of the file, e.g. with h5py:
+
+    with h5py.File('export.h5') as file:
+        S = file['coil_003'][:, :, 40]
+
+h5py and zarr are optional dependencies; available lists the formats that can be written.
+'''
+
+import json
+import numpy as np
+
+import b_calculation
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+# Export format -> file extension
+EXTENSIONS = {'hdf5': '.h5', 'zarr': '.zarr'}
+available = [name for name, module in (('hdf5', h5py), ('zarr', zarr)) if module is not None]
+
+
+class CoilDatasets():
+    '''
+    A class used to present per-coil datasets as a single (Nc, Nx, Ny, Nz) array
+
+    Supports the indexing Scanner.sensitivity_volume uses to fill its out array tile by tile
+    (out[..., xs, ys, zs] = block, written once per tile, see b_calculation.parallel_B), and slicing
+    along the coil axis (e.g., out[start:stop]) for a view of a run of coils.
+
+    Parameters
+    ----------
+    datasets : list
+        Datasets (or arrays) of shape (Nx, Ny, Nz), one per coil
+    '''
+
+    def __init__(self, datasets : list):
+        self.datasets = datasets
+        self.shape = (len(datasets),) + tuple(datasets[0].shape) if datasets else (0,)
+        self.dtype = datasets[0].dtype if datasets else None
+
+    def __len__(self) -> int:
+        return len(self.datasets)
+
+    def __getitem__(self, index):
+        coil, rest = _split_index(index)
+        if isinstance(coil, slice) and rest == (Ellipsis,):
+            return CoilDatasets(self.datasets[coil])
+        elif isinstance(coil, slice):
+            return np.stack([dataset[rest] for dataset in self.datasets[coil]])
+        return self.datasets[coil][rest]
+
+    def __setitem__(self, index, value):
+        coil, rest = _split_index(index)
+        if isinstance(coil, slice): # value has a leading coil axis (or is a scalar)
+            for i, dataset in enumerate(self.datasets[coil]):
+                dataset[rest] = value[i] if np.ndim(value) else value
+        else:
+            self.datasets[coil][rest] = value
+
+
+def _split_index(index) -> tuple:
+    # Split an index into (index along the coil axis, index into each coil's dataset)
+    index = index if isinstance(index, tuple) else (index,)
+    coil = slice(None) if index[0] is Ellipsis else index[0]
+    return coil, index[1:] if len(index) > 1 else (Ellipsis,)
+
+
+def export_path(path : str, format : str) -> str:
+    '''
+    Add the format's extension to an export path that lacks it (e.g., export -> export.h5)
+    '''
+    extensions = ('.h5', '.hdf5') if format == 'hdf5' else (EXTENSIONS[format],)
+    return path if path.endswith(extensions) else path + EXTENSIONS[format]
+
+
+def chunk_shape(dims : tuple, slab : int = None, edge : int = 64) -> tuple:
+    '''
+    Chunk shape of the per-coil datasets: at most edge voxels along x and y, and slab planes along
+    z, so each chunk is written (and compressed) exactly once as the z-slabs are computed
+    '''
+    return (min(dims[0], edge), min(dims[1], edge), min(dims[2], slab if slab is not None else edge))
+
+
+def create(path : str, format : str, scanner, dtype : str, slab : int = None, compression : int = 4,
+           coil_maps : bool = True, combined : dict = None) -> tuple:
+    '''
+    Create a chunked, compressed HDF5 file or Zarr store to export the sensitivity of every coil
+    and/or maps combining all coils (e.g., rss, see b_calculation.combined_maps) to
+
+    Parameters
+    ----------
+    path : str
+        Path of the file (HDF5) or directory (Zarr); see export_path
+    format : str
+        'hdf5' or 'zarr'
+    scanner : Scanner
+        Scanner whose coils are exported
+    dtype : str
+        Type of the sensitivities (e.g., 'complex128')
+    slab : int, optional
+        Number of z-planes computed at a time (see chunk_shape)
+    compression : int, optional
+        gzip compression level of the HDF5 datasets (Zarr uses its default compressor)
+    coil_maps : bool, optional
+        Whether to create the per-coil datasets
+    combined : dict, optional
+        Name -> type of each combined map to create a dataset of shape (Nx, Ny, Nz) for
+
+    Returns
+    -------
+    tuple
+        (CoilDatasets to write the (Nc, Nx, Ny, Nz) sensitivities into, or None without coil_maps,
+        dict of the datasets of the combined maps, function closing the file)
+
+    Raises
+    ------
+    ValueError
+        If the format is unknown or its library is not installed
+    '''
+    if format not in EXTENSIONS:
+        raise ValueError("Unknown export format '" + str(format) + "'; format should be one of " + ', '.join(EXTENSIONS))
+    if format not in available:
+        raise ValueError('Exporting to ' + format + ' requires ' + ('h5py' if format == 'hdf5' else 'zarr') + ' to be installed')
+
+    axes = b_calculation.grid_axes(scanner.get_bbox(), scanner.get_vol_res())
+    dims = tuple(len(axis) for axis in axes)
+    chunks = chunk_shape(dims, slab)
+
+    if format == 'hdf5':
+        root = h5py.File(path, 'w')
+        make = lambda name, **kwargs: root.create_dataset(name, compression='gzip', compression_opts=compression,
+                                                          shuffle=True, **kwargs)
+        close = root.close
+    else:
+        root = zarr.open_group(path, mode='w')
+        make = root.create_dataset
+        close = lambda: None
+
+    root.attrs['quantity'] = 'sensitivity (Bx - i By) of each coil at 1 A, with all physical constants set to one'
+    root.attrs['bbox'] = [float(value) for value in scanner.get_bbox()]
+    root.attrs['vol_res'] = [float(value) for value in scanner.get_vol_res()]
+    root.attrs['n_coils'] = len(scanner.coils)
+    for name, axis in zip('xyz', axes):
+        make(name, data=axis)
+
+    datasets = []
+    for i, coil in enumerate(scanner.coils if coil_maps else []):
+        dataset = make('coil_' + str(i).zfill(3), shape=dims, chunks=chunks, dtype=dtype)
+        # Line type, parameters, and integration limits of every segment (see Segment.geometry_key)
+        dataset.attrs['segments'] = json.dumps([segment.geometry_key() for segment in coil.segments])
+        datasets.append(dataset)
+    if not coil_maps:
+        # Without the per-coil datasets, keep the geometry of every coil on the file itself
+        root.attrs['coil_segments'] = json.dumps([[segment.geometry_key() for segment in coil.segments]
+                                                  for coil in scanner.coils])
+
+    combined_datasets = {name: make(name, shape=dims, chunks=chunks, dtype=combined_dtype)
+                         for name, combined_dtype in (combined or {}).items()}
+
+    return CoilDatasets(datasets) if coil_maps else None, combined_datasets, close
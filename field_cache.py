@@ -0,0 +1,394 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+class FieldCache():
+    '''
+    A class used to represent a memory-capped least-recently-used cache of field arrays
+
+    Entries are kept in order of use; once the arrays held take more than max_bytes, the least
+    recently used ones are evicted. Stored arrays are made read-only since they are shared by
+    everyone that looks them up. The cache may be shared between threads.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Upper bound on the total size (in bytes) of the arrays held
+
+    Methods
+    -------
+    get(self, key : tuple) -> np.ndarray | None
+        Return the array stored under key (marking it as most recently used), or None
+    put(self, key : tuple, value : np.ndarray) -> np.ndarray
+        Store value under key, evicting the least recently used entries beyond max_bytes
+    clear(self)
+        Remove every entry
+    items(self) -> list[tuple]
+        Snapshot of the (key, array) entries
+    '''
+
+    def __init__(self, max_bytes : int = 256 * 2 ** 20):
+        '''
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Upper bound on the total size (in bytes) of the arrays held; default is 256 MiB
+        '''
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key : tuple) -> bool:
+        return key in self.entries
+
+    def get(self, key : tuple) -> np.ndarray | None:
+        '''
+        Return the array stored under key and mark it as most recently used
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable key of the entry
+
+        Returns
+        -------
+        np.ndarray | None
+            The stored (read-only) array, or None if there is no such entry
+        '''
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key : tuple, value : np.ndarray) -> np.ndarray:
+        '''
+        Store value under key, evicting least recently used entries to stay within max_bytes
+
+        An array larger than max_bytes on its own is not stored.
+
+        Parameters
+        ----------
+        key : tuple
+            Hashable key of the entry
+        value : np.ndarray
+            Array to store; it is made read-only
+
+        Returns
+        -------
+        np.ndarray
+            value
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+            if value.nbytes > self.max_bytes:
+                return value
+
+            value.flags.writeable = False
+            self.entries[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+            return value
+
+    def items(self) -> list[tuple]:
+        '''
+        Return a snapshot of the entries, from least to most recently used
+
+        Returns
+        -------
+        list[tuple]
+            (key, array) pairs
+        '''
+        with self.lock:
+            return list(self.entries.items())
+
+    def clear(self):
+        '''
+        Remove every entry
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+class DiskFieldCache():
+    '''
+    A class used to represent a persistent, content-addressed cache of field arrays on disk
+
+    Each array is stored as an .npy file named after a hash of everything it depends on (see key),
+    so the same field is found again across sessions and workspaces. Hits are memory-mapped
+    read-only, and nothing is read until it is used. Once the files take more than max_bytes, the
+    least recently used ones (by modification time, which every hit refreshes) are deleted.
+
+    Several processes may share a directory. Files are written under a temporary name and
+    renamed into place, so a reader never sees a partial file. An entry evicted by another
+    process is simply a miss, and arrays already mapped stay valid after their file is deleted.
+    Each process only learns of the others' writes when it rescans the directory (at least every
+    RESCAN_INTERVAL seconds), so the cap may be briefly exceeded while several of them write.
+
+    Parameters
+    ----------
+    directory : str
+        Directory holding the cache files (created on first use)
+    max_bytes : int
+        Upper bound on the total size (in bytes) of the files held
+
+    Methods
+    -------
+    key(*parts) -> str
+        Canonical hash of the description of a field
+    get(self, key : str) -> np.memmap | None
+        Memory-map the array stored under key (marking it as most recently used), or return None
+    put(self, key : str, value : np.ndarray) -> np.ndarray
+        Store value under key, evicting the least recently used files beyond max_bytes
+    evict(self)
+        Delete the least recently used files beyond max_bytes
+    clear(self)
+        Remove every entry
+    '''
+
+    VERSION = 1 # Part of every key; bump it whenever the field calculations change their results
+    RESCAN_INTERVAL = 10 # Seconds after which put rescans the directory even when within max_bytes
+
+    def __init__(self, directory : str, max_bytes : int = 2 * 2 ** 30):
+        '''
+        Parameters
+        ----------
+        directory : str
+            Directory holding the cache files (created on first use)
+        max_bytes : int, optional
+            Upper bound on the total size (in bytes) of the files held; default is 2 GiB
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.nbytes = None # Estimated size of the files held; None until the directory is first scanned
+        self.scanned_at = 0. # time.time() of the last scan
+        self.lock = threading.Lock()
+
+    @classmethod
+    def key(cls, *parts) -> str:
+        '''
+        Get the canonical hash of the description of a field (e.g., a segment's geometry key, the
+        bounding box, the volume resolution, the engine, and its tolerance)
+
+        Numbers are compared as floats and tuples as lists, so equal descriptions give equal keys
+        regardless of how they were built
+
+        Returns
+        -------
+        str
+            Hex digest identifying the field
+        '''
+        return hashlib.sha256(json.dumps([cls.VERSION, _canonical(parts)]).encode()).hexdigest()
+
+    def path(self, key : str) -> str:
+        '''
+        Get the path of the file holding the entry stored under key
+        '''
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key : str) -> np.memmap | None:
+        '''
+        Memory-map the array stored under key and mark it as most recently used
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry (see key)
+
+        Returns
+        -------
+        np.memmap | None
+            The stored (read-only) array, or None if there is no such entry
+        '''
+        path = self.path(key)
+        try:
+            value = np.load(path, mmap_mode='r')
+        except FileNotFoundError: # Not cached, or evicted by another process
+            return None
+        except (ValueError, OSError): # Unreadable file; drop it
+            _remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError: # E.g., a read-only shared cache; the entry is still valid, it just ages
+            pass
+        return value
+
+    def put(self, key : str, value : np.ndarray) -> np.ndarray:
+        '''
+        Store value under key, evicting least recently used files to stay within max_bytes
+
+        An array larger than max_bytes on its own is not stored, and a failure to write (e.g., a
+        full disk) leaves the cache unchanged.
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry (see key)
+        value : np.ndarray
+            Array to store
+
+        Returns
+        -------
+        np.ndarray
+            value
+        '''
+        if value.nbytes > self.max_bytes:
+            return value
+
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(handle, 'wb') as file:
+                np.save(file, value)
+            os.replace(temp_path, self.path(key))
+        except OSError as error:
+            print('Could not write to the field cache:', error)
+            if temp_path is not None:
+                _remove(temp_path)
+            return value
+
+        with self.lock:
+            if self.nbytes is not None:
+                self.nbytes += value.nbytes
+            if (self.nbytes is None or self.nbytes > self.max_bytes
+                    or time.time() - self.scanned_at > self.RESCAN_INTERVAL):
+                self.evict()
+        return value
+
+    def evict(self):
+        '''
+        Delete the least recently used files until the rest fit within max_bytes
+
+        Also deletes temporary files left behind by writers that died. Only one process evicts at
+        a time (see _try_lock); the others skip eviction while it does.
+        '''
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            if not _try_lock(lock_file): # Another process is evicting
+                return
+            try:
+                entries = []
+                with os.scandir(self.directory) as scan:
+                    for entry in scan:
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        if entry.name.endswith('.npy'):
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        elif entry.name.endswith('.tmp') and stat.st_mtime < time.time() - 3600:
+                            _remove(entry.path)
+
+                self.nbytes = sum(size for _, size, _ in entries)
+                self.scanned_at = time.time()
+                for _, size, path in sorted(entries):
+                    if self.nbytes <= self.max_bytes:
+                        break
+                    if _remove(path):
+                        self.nbytes -= size
+            finally:
+                _unlock(lock_file)
+
+    def clear(self):
+        '''
+        Remove every entry
+        '''
+        with self.lock:
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith('.npy'):
+                        _remove(os.path.join(self.directory, name))
+            self.nbytes = 0
+
+
+def _try_lock(file) -> bool:
+    # Take an exclusive lock on an open file without waiting: flock on POSIX, and a lock on the
+    # file's first byte on Windows (released by _unlock); False if another process holds it
+    try:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(file):
+    # Release a lock taken by _try_lock (flock locks are also released when the file is closed)
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def default_disk_cache() -> DiskFieldCache | None:
+    '''
+    Get the on-disk field cache shared by the field calculations (see Segment.calc_seg_B), or None
+    if it is disabled
+
+    The cache lives in the directory named by the SIMMR_FIELD_CACHE environment variable (default
+    ~/.cache/simmr/fields; an empty value disables it), capped at SIMMR_FIELD_CACHE_BYTES bytes
+    (default 2 GiB). Use set_default_disk_cache to replace it.
+    '''
+    global _default_disk_cache
+    if _default_disk_cache is False:
+        directory = os.environ.get('SIMMR_FIELD_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'simmr', 'fields'))
+        max_bytes = int(os.environ.get('SIMMR_FIELD_CACHE_BYTES', 2 * 2 ** 30))
+        _default_disk_cache = DiskFieldCache(directory, max_bytes) if directory else None
+    return _default_disk_cache
+
+
+def set_default_disk_cache(cache : DiskFieldCache | None):
+    '''
+    Replace the on-disk field cache shared by the field calculations (None disables it)
+    '''
+    global _default_disk_cache
+    _default_disk_cache = cache
+
+
+_default_disk_cache = False # Not created yet (see default_disk_cache)
+
+
+def _canonical(value):
+    # JSON-able form of a key part in which equal descriptions are written identically
+    if isinstance(value, (tuple, list, np.ndarray)):
+        return [_canonical(item) for item in value]
+    elif isinstance(value, (bool, np.bool_, str)) or value is None:
+        return value.item() if isinstance(value, np.bool_) else value
+    elif isinstance(value, type):
+        return np.dtype(value).name
+    elif isinstance(value, np.dtype):
+        return value.name
+    return float(value)
+
+
+def _remove(path : str) -> bool:
+    # Delete a file, tolerating another process having deleted it first (or holding it open on Windows)
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
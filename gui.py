@@ -13,6 +13,7 @@ from init_scanner_ui import InitScannerUI
 from scanner_init_ui import SetScannerUI
 from coil_control_ui import CoilOverviewUI
 from coil_design_ui import CoilDesignUI
+import export_formats
 
 class MainWindow(QMainWindow):
 
@@ -162,6 +163,48 @@ class View_Widget(QWidget):
         tmp_btn_lo.addWidget(self.slice_loc_btn)
         btn_layout.addLayout(tmp_btn_lo)
 
+        tmp_btn_lo = QVBoxLayout()
+        tmp_lbl = QLabel('Slice Fields')
+        tmp_lbl.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Maximum)
+        tmp_btn_lo.addWidget(tmp_lbl)
+        self.slice_mode_btn = QComboBox()
+        self.slice_mode_btn.addItem('Per Slice')
+        self.slice_mode_btn.addItem('Whole Volume')
+        tmp_btn_lo.addWidget(self.slice_mode_btn)
+        btn_layout.addLayout(tmp_btn_lo)
+
+        tmp_btn_lo = QVBoxLayout()
+        tmp_lbl = QLabel('Export Precision')
+        tmp_lbl.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Maximum)
+        tmp_btn_lo.addWidget(tmp_lbl)
+        self.export_precision_btn = QComboBox()
+        self.export_precision_btn.addItem('complex128')
+        self.export_precision_btn.addItem('complex64')
+        tmp_btn_lo.addWidget(self.export_precision_btn)
+        btn_layout.addLayout(tmp_btn_lo)
+
+        tmp_btn_lo = QVBoxLayout()
+        tmp_lbl = QLabel('Export Format')
+        tmp_lbl.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Maximum)
+        tmp_btn_lo.addWidget(tmp_lbl)
+        self.export_format_btn = QComboBox()
+        self.export_format_btn.addItem('npy')
+        for format in export_formats.available: # Chunked, compressed formats whose library is installed
+            self.export_format_btn.addItem(format)
+        tmp_btn_lo.addWidget(self.export_format_btn)
+        btn_layout.addLayout(tmp_btn_lo)
+
+        tmp_btn_lo = QVBoxLayout()
+        tmp_lbl = QLabel('Export Maps')
+        tmp_lbl.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Maximum)
+        tmp_btn_lo.addWidget(tmp_lbl)
+        self.export_maps_btn = QComboBox()
+        self.export_maps_btn.addItem('Per Coil')
+        self.export_maps_btn.addItem('Per Coil + Combined')
+        self.export_maps_btn.addItem('Combined')
+        tmp_btn_lo.addWidget(self.export_maps_btn)
+        btn_layout.addLayout(tmp_btn_lo)
+
         self.export_btn = QPushButton('Export')
         self.export_btn.clicked.connect(self.export_btn_clicked)
         btn_layout.addWidget(self.export_btn)
@@ -0,0 +1,128 @@
+'''
+Optional Numba backend for b_calculation.scanner_B
+
+The NumPy kernels evaluate one segment kind at a time over whole blocks of voxels, which allocates
+several block-sized temporaries per chunk of segments (separations, norms, cross products). Here
+the per-voxel sums over straight segments and quadrature nodes are fused into a single compiled
+loop that is parallelised over voxels and writes straight into the output, with no temporaries.
+
+Numba is an optional dependency: when it is not installed, available is False and scanner_B keeps
+using the NumPy kernels. The kernels below are plain Python in that case (far too slow to be used,
+but they can still be called to check results on a handful of voxels).
+'''
+
+import numpy as np
+
+try:
+    import numba
+    available = True
+except ImportError:
+    numba = None
+    available = False
+
+
+def _jit(fn : callable) -> callable:
+    # Compile with Numba when it is installed; otherwise leave the function as plain Python
+    if available:
+        return numba.njit(parallel=True, cache=True)(fn)
+    return fn
+
+
+prange = numba.prange if available else range
+
+
+def limit_threads(n_threads : int):
+    '''
+    Cap the number of threads used by the compiled kernels in this process (e.g., in each worker
+    of a process pool, so processes x threads does not oversubscribe the CPUs)
+    '''
+    if available:
+        numba.set_num_threads(max(1, min(n_threads, numba.config.NUMBA_NUM_THREADS)))
+
+
+def open_vectors(x : np.ndarray, y : np.ndarray, z : np.ndarray) -> tuple:
+    '''
+    Return the 1D coordinate vectors of an open grid (x of shape (Nx, 1, 1), y of shape (1, Ny, 1)
+    and z of shape (1, 1, Nz), as passed by tiled_B), or None if the coordinates are not one
+    '''
+    shapes = [np.shape(x), np.shape(y), np.shape(z)]
+    for axis, shape in enumerate(shapes):
+        if len(shape) != 3 or any(size != 1 for i, size in enumerate(shape) if i != axis):
+            return None
+    return (np.ascontiguousarray(np.ravel(x)), np.ascontiguousarray(np.ravel(y)),
+            np.ascontiguousarray(np.ravel(z)))
+
+
+@_jit
+def fused_B(x, y, z, straight_start, straight_end, straight_coil, node_pos, node_dl, node_coil, out):
+    '''
+    Add the field of all straight segments and quadrature nodes to out
+
+    Same formulas as b_calculation.straight_B and node_B. Voxels lying on a wire or a node are
+    left unchanged (i.e., contribute zero).
+
+    Parameters
+    ----------
+    x : np.ndarray
+        1D x-coordinates of the voxel grid
+    y : np.ndarray
+        1D y-coordinates of the voxel grid
+    z : np.ndarray
+        1D z-coordinates of the voxel grid
+    straight_start : np.ndarray
+        (k, 3) start points of the straight segments
+    straight_end : np.ndarray
+        (k, 3) end points of the straight segments
+    straight_coil : np.ndarray
+        (k,) coil index of each straight segment
+    node_pos : np.ndarray
+        (n, 3) positions of the quadrature nodes
+    node_dl : np.ndarray
+        (n, 3) weighted tangents (current elements) of the quadrature nodes
+    node_coil : np.ndarray
+        (n,) coil index of each node
+    out : np.ndarray
+        (Nc, 3, Nx, Ny, Nz) array to accumulate the fields of every coil into
+    '''
+    n_x, n_y, n_z = x.shape[0], y.shape[0], z.shape[0]
+
+    # One task per (x, y) column so no two threads ever write the same voxel
+    for column in prange(n_x * n_y):
+        i = column // n_y
+        j = column % n_y
+        for k in range(n_z):
+            p_x, p_y, p_z = x[i], y[j], z[k]
+
+            for s in range(straight_coil.shape[0]):
+                d_x = straight_end[s, 0] - straight_start[s, 0]
+                d_y = straight_end[s, 1] - straight_start[s, 1]
+                d_z = straight_end[s, 2] - straight_start[s, 2]
+                r1_x = p_x - straight_start[s, 0]
+                r1_y = p_y - straight_start[s, 1]
+                r1_z = p_z - straight_start[s, 2]
+                r2_x = p_x - straight_end[s, 0]
+                r2_y = p_y - straight_end[s, 1]
+                r2_z = p_z - straight_end[s, 2]
+
+                r1 = np.sqrt(r1_x * r1_x + r1_y * r1_y + r1_z * r1_z)
+                r2 = np.sqrt(r2_x * r2_x + r2_y * r2_y + r2_z * r2_z)
+                r_sum = r1 + r2
+                denom = r1 * r2 * (r_sum * r_sum - (d_x * d_x + d_y * d_y + d_z * d_z))
+                if denom > 0:
+                    scale = 2 * r_sum / denom
+                    c = straight_coil[s]
+                    out[c, 0, i, j, k] += (d_y * r1_z - d_z * r1_y) * scale
+                    out[c, 1, i, j, k] += (d_z * r1_x - d_x * r1_z) * scale
+                    out[c, 2, i, j, k] += (d_x * r1_y - d_y * r1_x) * scale
+
+            for n in range(node_coil.shape[0]):
+                sep_x = p_x - node_pos[n, 0]
+                sep_y = p_y - node_pos[n, 1]
+                sep_z = p_z - node_pos[n, 2]
+                norm_2 = sep_x * sep_x + sep_y * sep_y + sep_z * sep_z
+                if norm_2 > 0:
+                    inv_norm_3 = 1 / (norm_2 * np.sqrt(norm_2))
+                    c = node_coil[n]
+                    out[c, 0, i, j, k] += (node_dl[n, 1] * sep_z - node_dl[n, 2] * sep_y) * inv_norm_3
+                    out[c, 1, i, j, k] += (node_dl[n, 2] * sep_x - node_dl[n, 0] * sep_z) * inv_norm_3
+                    out[c, 2, i, j, k] += (node_dl[n, 0] * sep_y - node_dl[n, 1] * sep_x) * inv_norm_3
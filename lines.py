@@ -1,5 +1,4 @@
 import numpy as np
-import sympy as smp
 import matplotlib.pyplot as plt
 
 class Curved:
@@ -8,10 +7,26 @@ class Curved:
 
     Attributes
     ----------
+    centre : np.ndarray
+        Centre of the ellipse
+    r1 : np.ndarray
+        First radius vector (i.e., the position relative to the centre at parameter value 0)
+    r2 : np.ndarray
+        Second radius vector (i.e., the position relative to the centre at parameter value pi/2)
     fn : sympy.expr
-        Sympy expression corresponding to the function describing the curved line (in 3D space)
+        Sympy expression corresponding to the function describing the curved line (in 3D space);
+        only built (and sympy only imported) when accessed
     parameter : smp.symbols
         Sympy symbol corresponding to the parameter variable for the function
+
+    Methods
+    -------
+    position(self, t : float | np.ndarray) -> np.ndarray
+        Evaluate the position on the curve at parameter value(s) t
+    tangent(self, t : float | np.ndarray) -> np.ndarray
+        Evaluate the derivative of the position with respect to t
+    is_circular(self, rtol : float = 1e-9) -> bool
+        Check whether the ellipse is a circle (perpendicular radii of equal length)
     '''
 
     def __init__(self, c_x : float, c_y : float, c_z : float,
@@ -43,11 +58,9 @@ class Curved:
             Z-component of the second radius vector (from the centre of the ellipse) 
         '''
 
-        self.parameter = smp.symbols('t')
-
-        centre = smp.Matrix([c_x, c_y, c_z])
-        dir_1 = smp.Matrix([r1_x, r1_y, r1_z])
-        dir_2 = smp.Matrix([r2_x, r2_y, r2_z])
+        self.centre = np.array([c_x, c_y, c_z], dtype=float)
+        self.r1 = np.array([r1_x, r1_y, r1_z], dtype=float)
+        self.r2 = np.array([r2_x, r2_y, r2_z], dtype=float)
 
         # UNDER CONSTRUCTION : MAKING SO THAT IT IS ALWAYS COUNTERCLOCKWISE
 
@@ -69,8 +82,84 @@ class Curved:
 
 
         # END CONSTRUCTION ZONE
-        
-        self.fn = centre + dir_1 * smp.cos(self.parameter) + dir_2 * smp.sin(self.parameter)
+
+    @property
+    def parameter(self):
+        import sympy as smp
+        return smp.symbols('t')
+
+    @property
+    def fn(self):
+        import sympy as smp
+
+        centre = smp.Matrix(self.centre.tolist())
+        dir_1 = smp.Matrix(self.r1.tolist())
+        dir_2 = smp.Matrix(self.r2.tolist())
+
+        return centre + dir_1 * smp.cos(self.parameter) + dir_2 * smp.sin(self.parameter)
+
+    def position(self, t : float | np.ndarray) -> np.ndarray:
+        '''
+        Evaluate the position on the curve, c + r1 cos(t) + r2 sin(t)
+
+        Parameters
+        ----------
+        t : float | np.ndarray
+            Parameter value(s) at which to evaluate the curve
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (3, *np.shape(t)) of x-, y-, and z-coordinates
+        '''
+        t = np.asarray(t)
+        index = (slice(None),) + (None,) * t.ndim
+        return self.centre[index] + self.r1[index] * np.cos(t) + self.r2[index] * np.sin(t)
+
+    def tangent(self, t : float | np.ndarray) -> np.ndarray:
+        '''
+        Evaluate the derivative of the position with respect to t, -r1 sin(t) + r2 cos(t)
+
+        Parameters
+        ----------
+        t : float | np.ndarray
+            Parameter value(s) at which to evaluate the derivative
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (3, *np.shape(t)) of x-, y-, and z-components
+        '''
+        t = np.asarray(t)
+        index = (slice(None),) + (None,) * t.ndim
+        return -self.r1[index] * np.sin(t) + self.r2[index] * np.cos(t)
+
+    def is_circular(self, rtol : float = 1e-9) -> bool:
+        '''
+        Check whether the curve is a circle, i.e., whether the two radius vectors are
+        perpendicular and of equal length
+
+        Parameters
+        ----------
+        rtol : float - Optional
+            Relative tolerance used for both the length and the perpendicularity comparison
+
+        Returns
+        -------
+        True
+            If the curve is a circle (so it can be treated as a circular arc)
+        False
+            If the curve is a true ellipse
+        '''
+
+        r1_sq = np.dot(self.r1, self.r1)
+        r2_sq = np.dot(self.r2, self.r2)
+
+        if r1_sq == 0 or r2_sq == 0:
+            return False
+
+        return bool(abs(r1_sq - r2_sq) <= rtol * max(r1_sq, r2_sq)
+                    and abs(np.dot(self.r1, self.r2)) <= rtol * max(r1_sq, r2_sq))
 
 class Straight:
     '''
@@ -78,10 +167,22 @@ class Straight:
 
     Attributes
     ----------
+    point : np.ndarray
+        Point on the line (i.e., the position at parameter value 0)
+    dir : np.ndarray
+        Direction vector of the line (i.e., the change in position per unit of the parameter)
     fn : sympy.expr
-        Sympy expression corresponding to the function describing the straight line (in 3D space)
+        Sympy expression corresponding to the function describing the straight line (in 3D space);
+        only built (and sympy only imported) when accessed
     parameter : smp.symbols
         Sympy symbol corresponding to the parameter variable for the function
+
+    Methods
+    -------
+    position(self, t : float | np.ndarray) -> np.ndarray
+        Evaluate the position on the line at parameter value(s) t
+    tangent(self, t : float | np.ndarray) -> np.ndarray
+        Evaluate the derivative of the position with respect to t
     '''
 
     def __init__(self, p_x : float, p_y : float, p_z : float,
@@ -105,9 +206,55 @@ class Straight:
             Z-component of the direction vector
         '''
 
-        self.parameter = smp.symbols('t')
+        self.point = np.array([p_x, p_y, p_z], dtype=float)
+        self.dir = np.array([d_x, d_y, d_z], dtype=float)
+
+    @property
+    def parameter(self):
+        import sympy as smp
+        return smp.symbols('t')
+
+    @property
+    def fn(self):
+        import sympy as smp
 
-        point = smp.Matrix([p_x, p_y, p_z])
-        dir = smp.Matrix([d_x, d_y, d_z])
+        point = smp.Matrix(self.point.tolist())
+        dir = smp.Matrix(self.dir.tolist())
+
+        return point + self.parameter * dir
+
+    def position(self, t : float | np.ndarray) -> np.ndarray:
+        '''
+        Evaluate the position on the line, p + t d
 
-        self.fn = point + self.parameter * dir
+        Parameters
+        ----------
+        t : float | np.ndarray
+            Parameter value(s) at which to evaluate the line
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (3, *np.shape(t)) of x-, y-, and z-coordinates
+        '''
+        t = np.asarray(t)
+        index = (slice(None),) + (None,) * t.ndim
+        return self.point[index] + self.dir[index] * t
+
+    def tangent(self, t : float | np.ndarray) -> np.ndarray:
+        '''
+        Evaluate the derivative of the position with respect to t (i.e., the direction vector)
+
+        Parameters
+        ----------
+        t : float | np.ndarray
+            Parameter value(s) at which to evaluate the derivative
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (3, *np.shape(t)) of x-, y-, and z-components
+        '''
+        t = np.asarray(t)
+        index = (slice(None),) + (None,) * t.ndim
+        return np.broadcast_to(self.dir[index], (3,) + t.shape)
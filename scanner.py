@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import numpy as np
 from coil import Coil
+import b_calculation
 
 class Scanner:
     '''
@@ -28,6 +29,10 @@ class Scanner:
         3D plot all coils present in the scanner; return True if successful
     add_coils(self, coil : Coil) -> bool
         Validate and add passed coil to the list of coils present in the scanner
+    B_volume(self, volume_coords : list = None) -> np.ndarray
+        Calculate the magnetic field of every coil over a volume in one batched pass
+    sensitivity_volume(self, volume_coords : list = None) -> np.ndarray
+        Calculate the complex sensitivity of every coil over a volume, tile by tile
     '''
 
     def __init__(self, bbox : list, vol_res : list, coils : list[Coil] = []):
@@ -202,4 +207,104 @@ class Scanner:
         if index >= len(self.coils):
             raise ValueError('Requested index does not exist')
         
-        return self.coils[index]
\ No newline at end of file
+        return self.coils[index]
+
+    def B_volume(self, volume_coords : list = None, n_nodes : int = 64, tile : tuple = None,
+                 out : np.ndarray = None, workers : int = 1, dtype : type = np.float64,
+                 coils : list = None) -> np.ndarray:
+        '''
+        Calculate the magnetic field of every coil over a volume
+
+        The geometry of all segments of all coils is packed into arrays and evaluated against the
+        voxel grid in one batched pass (see b_calculation.scanner_B), instead of coil by coil and
+        segment by segment
+
+        Parameters
+        ----------
+        volume_coords : list, optional
+            6-element list of the volume (x-min, x-max, y-min, y-max, z-min, z-max); defaults to
+            the scanner's bounding box
+        n_nodes : int, optional
+            Number of Gauss-Legendre nodes used for segments without a closed-form solution
+        tile : tuple, optional
+            Number of voxels per tile along x, y, and z (None for the full extent); the volume is
+            evaluated one tile at a time so the calculation's temporaries stay proportional to the
+            tile (see b_calculation.tiled_B). Defaults to the whole volume in one tile
+        out : np.ndarray, optional
+            Array of shape (Nc, 3, Nx, Ny, Nz) to write the result into
+        workers : int, optional
+            Number of worker processes to spread the tiles, coils, and segments over (see
+            b_calculation.parallel_B); None uses every CPU. Defaults to 1 (no worker processes)
+        dtype : type, optional
+            np.float64 (default) or np.float32; single precision halves memory at a relative error
+            of about 1e-7 * |r| / d for a voxel at distance d from the nearest conductor (see
+            b_calculation.scanner_B)
+        coils : list, optional
+            Coils to evaluate (e.g., only those not found in a cache); defaults to every coil of the
+            scanner
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (Nc, 3, Nx, Ny, Nz) of the x, y, and z field components of every coil
+        '''
+
+        return self._volume(volume_coords, n_nodes, tile, out, workers, dtype, coils=coils)
+
+    def sensitivity_volume(self, volume_coords : list = None, n_nodes : int = 64, tile : tuple = None,
+                           out : np.ndarray = None, workers : int = 1, dtype : type = np.float64,
+                           coils : list = None, planes : slice = None, executor=None) -> np.ndarray:
+        '''
+        Calculate the complex sensitivity (Bx - i By) of every coil over a volume
+
+        Same as B_volume, but each tile is reduced to the sensitivity as soon as it is computed, so
+        the full field never has to be held and out can be a memory-mapped array (e.g.,
+        np.lib.format.open_memmap) that is filled tile by tile
+
+        Parameters
+        ----------
+        volume_coords : list, optional
+            6-element list of the volume (x-min, x-max, y-min, y-max, z-min, z-max); defaults to
+            the scanner's bounding box
+        n_nodes : int, optional
+            Number of Gauss-Legendre nodes used for segments without a closed-form solution
+        tile : tuple, optional
+            Number of voxels per tile along x, y, and z (None for the full extent)
+        out : np.ndarray, optional
+            Complex array of shape (Nc, Nx, Ny, Nz) to write the result into
+        workers : int, optional
+            Number of worker processes (see B_volume). Defaults to 1 (no worker processes)
+        dtype : type, optional
+            np.float64 (default) or np.float32, giving a complex128 or complex64 result (see B_volume)
+        coils : list, optional
+            Coils to evaluate; defaults to every coil of the scanner
+        planes : slice, optional
+            Only evaluate these z-planes of the volume (e.g., one slab at a time); defaults to all of them
+        executor : ProcessPoolExecutor, optional
+            Pool of worker processes to reuse across calls (see b_calculation.process_pool), e.g. when
+            evaluating one slab at a time; by default each call with workers != 1 starts its own
+
+        Returns
+        -------
+        np.ndarray
+            Complex array of shape (Nc, Nx, Ny, Nz) of the sensitivity of every coil
+        '''
+        return self._volume(volume_coords, n_nodes, tile, out, workers, dtype, b_calculation.sensitivity, coils, planes,
+                            executor)
+
+    def _volume(self, volume_coords, n_nodes, tile, out, workers, dtype=np.float64, transform=None, coils=None,
+                planes=None, executor=None):
+        volume_coords = volume_coords if volume_coords is not None else self.bbox
+        x_dim, y_dim, z_dim = b_calculation.grid_axes(volume_coords, self.vol_res)
+        z_dim = z_dim[planes] if planes is not None else z_dim
+        geometry = b_calculation.pack_geometry(coils if coils is not None else self.coils, n_nodes)
+
+        if workers != 1:
+            return b_calculation.parallel_B(geometry, x_dim, y_dim, z_dim, tile, workers, out, transform, dtype,
+                                            executor)
+
+        if transform is None:
+            kernel = lambda x, y, z: b_calculation.scanner_B(geometry, x, y, z, dtype=dtype)
+        else:
+            kernel = lambda x, y, z: transform(b_calculation.scanner_B(geometry, x, y, z, dtype=dtype))
+        return b_calculation.tiled_B(kernel, x_dim, y_dim, z_dim, tile, out)
@@ -1,8 +1,8 @@
-import sympy as smp
 from lines import Straight, Curved
 import numpy as np
 
 import b_calculation
+import field_cache
 
 from typing import TYPE_CHECKING
 
@@ -11,7 +11,7 @@ if TYPE_CHECKING:
 
 class Segment():
     '''
-    A class used to represent a line segment as a sympy function
+    A class used to represent a line segment of a parametrized line function
 
     Parameters
     ----------
@@ -26,8 +26,16 @@ class Segment():
     -------
     set_fn(self, fn : Curved | Straight) -> Curved | Straight
         Validate and set line function
+    get_integrand(self) -> callable, callable, callable
+        Get the (cached) compiled components of the Biot-Savart integrand
+    geometry_key(self) -> tuple
+        Hashable description of the segment's geometry (line type, parameters, and limits)
     get_coords(self) -> list, list, list
         Generate 3D coordinates of segment
+    get_polyline(self, n_points : int = 50) -> np.ndarray
+        Get (cached) points along the segment for plotting
+    calc_seg_B(self, volume_coords : list) -> np.ndarray
+        Calculate the magnetic field of the segment over a volume
     '''
 
     def __init__(self, fn : Curved | Straight, low_lim : float, up_lim : float, coil : 'Coil' = None, seg_B : np.ndarray = None):
@@ -45,6 +53,9 @@ class Segment():
         '''
         self.coil = None
         self.line_fn = None
+        self.integrand = None # Compiled (dBxdt, dBydt, dBzdt); built on first use, reset by set_line_fn
+        self.polyline = None # Points along the segment for plotting; see get_polyline
+        self.polyline_key = None # (geometry key, number of points) the polyline was computed for
         self.seg_B = seg_B
         self.low_lim = low_lim
         self.up_lim = up_lim
@@ -94,6 +105,7 @@ class Segment():
         
         if self.validate_line_fn(fn):
             self.line_fn = fn
+            self.integrand = None
             return True
         else:
             return False
@@ -174,50 +186,167 @@ class Segment():
 
         return self.coil
 
+    def get_integrand(self) -> tuple[callable, callable, callable]:
+        '''
+        Get the compiled x, y, and z components of the Biot-Savart integrand of the segment
+
+        The integrand is built from the line's numeric position and tangent evaluators the first time
+        it is requested after the line function is set; the result is stored in self.integrand and
+        reused by every later field calculation
+
+        Returns
+        -------
+        callable, callable, callable
+            dBxdt, dBydt, and dBzdt, each called as dBdt(t, x, y, z)
+        '''
+        if self.integrand is None:
+            self.integrand = b_calculation.dBdt_components(self.line_fn.position, self.line_fn.tangent)
+
+        return self.integrand
+
+    def has_closed_form(self) -> bool:
+        '''
+        Check whether the segment's field has a closed-form solution, i.e. whether it is a straight
+        segment or a circular arc (see calc_seg_B); only true ellipses must be integrated numerically
+
+        Returns
+        -------
+        bool
+            True for straight segments and circular arcs
+        '''
+        return type(self.line_fn) == Straight or (type(self.line_fn) == Curved and self.line_fn.is_circular())
+
+    def geometry_key(self) -> tuple:
+        '''
+        Get a hashable description of the segment's geometry
+
+        Two segments with equal keys produce identical fields, so the key can be used to cache
+        field calculations (together with the volume they were evaluated over)
+
+        Returns
+        -------
+        tuple
+            Line type name, the line's parameters (centre and radii, or point and direction), and
+            the lower and upper limits
+        '''
+        if type(self.line_fn) == Curved:
+            params = (*self.line_fn.centre, *self.line_fn.r1, *self.line_fn.r2)
+        else:
+            params = (*self.line_fn.point, *self.line_fn.dir)
+
+        return (type(self.line_fn).__name__, tuple(float(p) for p in params), float(self.low_lim), float(self.up_lim))
+
     def get_coords(self):
         '''
         Get the x-, y-, and z-coordinates in 3D space of a segment object
 
         Returns
         -------
-        list, list, list
+        np.ndarray, np.ndarray, np.ndarray
             X-, y-, and z-coordinates of the segment
         '''
-        t_range = np.linspace(self.low_lim, self.up_lim, 50)
-        coords = [[], [], []]
+        polyline = self.get_polyline()
+
+        return polyline[:, 0], polyline[:, 1], polyline[:, 2]
+
+    def get_polyline(self, n_points : int = 50) -> np.ndarray:
+        '''
+        Get evenly spaced (in the parameter) points along the segment, for plotting
 
-        fn = smp.lambdify(self.line_fn.parameter, self.line_fn.fn, modules=['numpy'])
+        The points are cached, and only recomputed once the segment's geometry changes
 
-        for element in t_range:
-            coords[0].extend(fn(element)[0])
-            coords[1].extend(fn(element)[1])
-            coords[2].extend(fn(element)[2])
+        Parameters
+        ----------
+        n_points : int, optional
+            Number of points
 
-        return coords[0], coords[1], coords[2]
+        Returns
+        -------
+        np.ndarray
+            Read-only array of shape (n_points, 3) of the x-, y-, and z-coordinates of the points
+        '''
+        key = (self.geometry_key(), n_points)
+        if self.polyline_key != key:
+            polyline = np.ascontiguousarray(self.line_fn.position(np.linspace(self.low_lim, self.up_lim, n_points)).T)
+            polyline.flags.writeable = False
+            self.polyline, self.polyline_key = polyline, key
+
+        return self.polyline
     
-    def calc_seg_B(self, volume_coords : list) -> np.ndarray:
+    def calc_seg_B(self, volume_coords : list, engine : str = 'auto', n_nodes : int = 64,
+                   tile : tuple = None, step : int = 1) -> np.ndarray:
         '''
         Calculates the segments magnetic effect and sets it as self.seg_B
+
+        The on-disk field cache (see field_cache.default_disk_cache) is consulted first, so a segment whose field
+        was computed over the same volume before, in any session or workspace, is memory-mapped instead. Coarse
+        previews (step > 1) are cheap to recompute and never reused, so they bypass it
+
+        Parameters
+        ----------
+        volume_coords : list
+            6-element list of the volume to evaluate over (x-min, x-max, y-min, y-max, z-min, z-max)
+        engine : str - Optional
+            'auto' evaluates straight segments with the closed-form straight wire solution, circular
+            Curved segments with the elliptic integral arc solution, and integrates all other segments
+            (i.e., true ellipses) with per-voxel adaptive Gauss-Legendre panels; 'adaptive' always uses
+            the adaptive panels; 'quad' always integrates with quad_vec (the reference); 'gauss' always
+            integrates with a fixed-order Gauss-Legendre rule
+        n_nodes : int - Optional
+            Number of Gauss-Legendre nodes used by the 'gauss' engine
+        tile : tuple - Optional
+            Number of voxels per tile along x, y, and z (None for the full extent), e.g. (None, None, 8)
+            for z-slabs of 8 planes; peak memory of the calculation is then proportional to the tile
+            instead of the volume. Defaults to the whole volume in one tile
+        step : int - Optional
+            Only evaluate every step-th voxel along each axis (and the last one), e.g., for a quick preview
+            that is interpolated back with b_calculation.upsample; the result then has the coarse grid's shape
+
+        Returns
+        -------
+        np.ndarray
+            Array of the x, y, and z components of the field over the volume (read-only if it went through
+            the on-disk cache)
+
+        Raises
+        ------
+        ValueError
+            If an unknown engine is requested
         '''
-        fn = self.line_fn.fn
+        if engine not in ('auto', 'adaptive', 'quad', 'gauss'):
+            raise ValueError("Unknown engine '" + str(engine) + "'; engine should be 'auto', 'adaptive', 'quad', or 'gauss'")
+
+        disk_cache = field_cache.default_disk_cache() if step == 1 else None
+        if disk_cache is not None:
+            # The tiling does not change the result, and only the 'gauss' engine has a tolerance to set
+            key = disk_cache.key('segment', self.geometry_key(), volume_coords, self.coil.scanner.vol_res, engine,
+                                 n_nodes if engine == 'gauss' else None)
+            seg_B = disk_cache.get(key)
+            if seg_B is not None:
+                return seg_B
+
+        x_dim, y_dim, z_dim = (dim[b_calculation.coarse_index(len(dim), step)]
+                               for dim in b_calculation.grid_axes(volume_coords, self.coil.scanner.vol_res))
 
-        x, y, z = smp.symbols(['x', 'y', 'z'])
-        r = smp.Matrix([x, y, z])
-        sep = r - fn
+        if engine == 'auto' and type(self.line_fn) == Straight:
+            start = self.line_fn.position(self.low_lim)
+            end = self.line_fn.position(self.up_lim)
+            kernel = lambda x, y, z: b_calculation.straight_B(start, end, x, y, z)
 
-        t = self.line_fn.parameter
+        elif engine == 'auto' and type(self.line_fn) == Curved and self.line_fn.is_circular():
+            kernel = lambda x, y, z: b_calculation.arc_B(self.line_fn.centre, self.line_fn.r1, self.line_fn.r2,
+                                                         self.low_lim, self.up_lim, x, y, z)
 
-        # Define the integrand
-        integrand = smp.diff(fn, t).cross(sep) / sep.norm()**3
-        # Get the x, y, and z components of the integrand
-        dBxdt = smp.lambdify([t, x, y, z], integrand[0])
-        dBydt = smp.lambdify([t, x, y, z], integrand[1])
-        dBzdt = smp.lambdify([t, x, y, z], integrand[2])
+        elif engine == 'gauss':
+            kernel = lambda x, y, z: b_calculation.B_gauss_legendre(self.low_lim, self.up_lim, *self.get_integrand(),
+                                                                    x, y, z, n_nodes=n_nodes)
 
-        # Add small tolerance to endpoint so it's included
-        x_dim = np.arange(volume_coords[0], volume_coords[1] + 1e-10, self.coil.scanner.vol_res[0])
-        y_dim = np.arange(volume_coords[2], volume_coords[3] + 1e-10, self.coil.scanner.vol_res[1])
-        z_dim = np.arange(volume_coords[4], volume_coords[5] + 1e-10, self.coil.scanner.vol_res[2])
-        xv, yv, zv = np.meshgrid(x_dim, y_dim, z_dim, indexing='ij')
+        elif engine == 'quad':
+            kernel = lambda x, y, z: b_calculation.B(self.low_lim, self.up_lim, *self.get_integrand(), x, y, z)
+
+        else:
+            kernel = lambda x, y, z: b_calculation.adaptive_B(self.low_lim, self.up_lim, self.line_fn.position,
+                                                              self.line_fn.tangent, x, y, z)
 
-        return b_calculation.B(self.low_lim, self.up_lim, dBxdt, dBydt, dBzdt, xv, yv, zv)
+        seg_B = b_calculation.tiled_B(kernel, x_dim, y_dim, z_dim, tile)
+        return disk_cache.put(key, seg_B) if disk_cache is not None else seg_B
@@ -1,8 +1,8 @@
+from functools import lru_cache
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import numpy as np
 from scipy.integrate import quad_vec
-import sympy as smp
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 def B(lower_lim : float, upper_lim : float, dBxdt : callable, dBydt : callable, 
@@ -59,6 +59,89 @@ def get_slice(data_volume: np.ndarray, slice: str, slice_loc: int,
         # return data_volume[:, :, slice_loc - 1]
         return data_volume[:, :, 0]
     
+@lru_cache(maxsize=8)
+def _grid_vectors(vol_res: tuple, bbox: tuple) -> tuple:
+    vectors = (np.arange(bbox[0], bbox[1] + 1e-10, vol_res[0]),
+               np.arange(bbox[2], bbox[3] + 1e-10, vol_res[1]),
+               np.arange(bbox[4], bbox[5] + 1e-10, vol_res[2]))
+    for vector in vectors:
+        vector.flags.writeable = False # Shared by every caller
+    return vectors
+
+def grid_vectors(vol_res=(1, 1, 1), bbox=(-1, -1, -1, 2, 2, 2)) -> tuple:
+    '''Get the x, y, and z coordinate vectors of the grid of a volume
+
+    The vectors are cached per volume (and read-only)
+
+    Parameters
+    ----------
+    vol_res : tuple, optional
+        The volume resolution, or voxel dimensions, in x, y, z
+    bbox : tuple, optional
+        The lower x, y, z bounds followed by the upper x, y, z bounds
+
+    Returns
+    -------
+    tuple
+        1D coordinate vectors along x, y, and z
+    '''
+
+    return _grid_vectors(tuple(float(res) for res in vol_res), tuple(float(bound) for bound in bbox))
+
+def get_plane_coords(slice: str, vol_res=(1, 1, 1), bbox=(-1, -1, -1, 2, 2, 2)) -> tuple:
+    '''Get the 2D coordinates of the points of a slice (for plotting), built from the coordinate
+    vectors of the two in-plane axes rather than sliced out of a 3D grid of the volume
+
+    Parameters
+    ----------
+    slice : str
+        Which plane the slice is taken from (x, y, or z)
+    vol_res : tuple, optional
+        The volume resolution, or voxel dimensions, in x, y, z
+    bbox : tuple, optional
+        The lower x, y, z bounds followed by the upper x, y, z bounds
+
+    Returns
+    -------
+    tuple
+        (first in-plane coordinates, second in-plane coordinates, first axis, second axis), where
+        the coordinates are read-only 2D arrays shaped like the slice (e.g., (Nx, Ny) for z) and the
+        axes are their names
+    '''
+
+    axis = 'xyz'.index(slice.lower())
+    first, second = [i for i in range(3) if i != axis]
+    vectors = grid_vectors(vol_res, bbox)
+    first_coords, second_coords = np.meshgrid(vectors[first], vectors[second], indexing='ij', copy=False)
+
+    return first_coords, second_coords, 'xyz'[first], 'xyz'[second]
+
+def nice_limit(value: float) -> float:
+    '''Round a colour scale limit up to the next "nice" number (1, 1.2, 1.5, 2, 2.5, 3, 4, 5, 6, or 8 times
+    a power of 10)
+
+    Neighbouring slices usually share a rounded limit, so their colour scales (and colorbars) need not change
+
+    Parameters
+    ----------
+    value : float
+        Non-negative limit to round
+
+    Returns
+    -------
+    float
+        Smallest nice number at least as large as value (0 for 0, or if value is not finite, e.g. NaN
+        for a field that is NaN everywhere)
+    '''
+
+    if not np.isfinite(value) or value <= 0:
+        return 0.
+    exponent = np.floor(np.log10(value))
+    for mantissa in (1, 1.2, 1.5, 2, 2.5, 3, 4, 5, 6, 8, 10):
+        limit = mantissa * 10 ** exponent
+        if limit >= value * (1 - 1e-12):
+            return float(limit)
+
 def plot_mag_phase(B_complex : np.ndarray, slice: str, slice_loc: float, 
                    vol_res=(1, 1, 1), bbox=(-1, -1, -1, 2, 2, 2), 
                    filename='mag_phase_stephen_test_II.png') -> None:
@@ -86,27 +169,11 @@ def plot_mag_phase(B_complex : np.ndarray, slice: str, slice_loc: float,
     -------
     none
     '''
-    x_dim = np.arange(bbox[0], bbox[1] + 1e-10, vol_res[0])
-    y_dim = np.arange(bbox[2], bbox[3] + 1e-10, vol_res[1])
-    z_dim = np.arange(bbox[4], bbox[5] + 1e-10, vol_res[2])
-    xv, yv, zv = np.meshgrid(x_dim, y_dim, z_dim, indexing='ij')
-
     B_slice = get_slice(B_complex, slice, slice_loc, vol_res=vol_res, bbox=bbox)
     B_mag = np.abs(B_slice)
     B_phase = np.angle(B_slice)
 
-    if slice == 'x':
-        ax1_label, ax2_label = 'y', 'z'
-        ax2 = get_slice(yv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(zv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
-    elif slice == 'y':
-        ax1_label, ax2_label = 'x', 'z'
-        ax2 = get_slice(xv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(zv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
-    elif slice == 'z':
-        ax1_label, ax2_label = 'x', 'y'
-        ax2 = get_slice(xv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(yv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
+    ax2, ax1, ax1_label, ax2_label = get_plane_coords(slice, vol_res=vol_res, bbox=bbox)
 
     fig, axes = plt.subplots(nrows=1, ncols=2)
 
@@ -165,27 +232,11 @@ def plot_fields(B_field : np.ndarray, slice: str, slice_loc: float,
     By = B_field[1, :, :, :]
     Bz = B_field[2, :, :, :]
 
-    x_dim = np.arange(bbox[0], bbox[1] + 1e-10, vol_res[0])
-    y_dim = np.arange(bbox[2], bbox[3] + 1e-10, vol_res[1])
-    z_dim = np.arange(bbox[4], bbox[5] + 1e-10, vol_res[2])
-    xv, yv, zv = np.meshgrid(x_dim, y_dim, z_dim, indexing='ij')
-
     Bx_slice = get_slice(Bx, slice, slice_loc, vol_res=vol_res, bbox=bbox)
     By_slice = get_slice(By, slice, slice_loc, vol_res=vol_res, bbox=bbox)
     Bz_slice = get_slice(Bz, slice, slice_loc, vol_res=vol_res, bbox=bbox)
 
-    if slice == 'x':
-        ax1_label, ax2_label = 'y', 'z'
-        ax2 = get_slice(yv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(zv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
-    elif slice == 'y':
-        ax1_label, ax2_label = 'x', 'z'
-        ax2 = get_slice(xv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(zv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
-    elif slice == 'z':
-        ax1_label, ax2_label = 'x', 'y'
-        ax2 = get_slice(xv, slice, slice_loc,vol_res=vol_res, bbox=bbox)
-        ax1 = get_slice(yv, slice, slice_loc, vol_res=vol_res, bbox=bbox)
+    ax2, ax1, ax1_label, ax2_label = get_plane_coords(slice, vol_res=vol_res, bbox=bbox)
 
     vmin = min(np.min(Bx_slice), np.min(By_slice), np.min(Bz_slice))
     vmax = max(np.max(Bx_slice), np.max(By_slice), np.max(Bz_slice))
@@ -170,7 +170,9 @@ def return_coords(fns: list, t : smp.core.symbol.Symbol, inputs : Iterable) -> t
     ----------
     fns : list
         This is a list of lambdified functions. Generally, the list will only be
-        length > 1 if the function you are trying to represent is piecwise
+        length > 1 if the function you are trying to represent is piecwise.
+        Line objects (Straight or Curved) may be passed instead, in which case
+        they are evaluated numerically without sympy
     t : smp.core.symbol.Symbol
         The parametrization parameter
     inputs : Iterable
@@ -187,10 +189,13 @@ def return_coords(fns: list, t : smp.core.symbol.Symbol, inputs : Iterable) -> t
     ys = []
     zs = []
     for fn in fns:
-        np_fn = smp.lambdify(t, fn)
-        x = [np_fn(t)[0][0] for t in inputs]
-        y = [np_fn(t)[1][0] for t in inputs]
-        z = [np_fn(t)[2][0] for t in inputs]
+        if hasattr(fn, 'position'):
+            x, y, z = (list(coords) for coords in fn.position(np.asarray(inputs, dtype=float)))
+        else:
+            np_fn = smp.lambdify(t, fn)
+            x = [np_fn(t)[0][0] for t in inputs]
+            y = [np_fn(t)[1][0] for t in inputs]
+            z = [np_fn(t)[2][0] for t in inputs]
 
         xs.append(x)
         ys.append(y)